@@ -0,0 +1,152 @@
+"""Cache of preprocessed positioning datasets
+
+This script allows the user to
+i) store the output of _preprocessing.preprocessing() in a binary (Feather) file, and
+ii) load it again (memory-mapped) when the same input files and preprocessing parameters are used,
+	instead of preprocessing the raw CSV files every time a downstream parameter changes.
+
+The cache key is a hash of the content of the input files, of the parameters (see _settings.py)
+that are used by the preprocessing (numberOfQuantiles, north, target_column, sampling_frequency, aggregation and compact_dtypes)
+and of CACHE_VERSION.
+
+This script requires that `pandas` and `pyarrow` be installed within the Python
+environment you are running this script in.
+
+This file can also be imported as a module and contains the following functions:
+
+	* preprocessing_cached (main) - returns the preprocessed dataset from the cache or preprocesses (and caches) it
+	* get_cache_key - calculates the cache key of a list of input files and preprocessing parameters
+	* read_cache - loads a cached preprocessed dataset (memory-mapped)
+	* write_cache - saves a preprocessed dataset in the cache
+"""
+import hashlib
+import os
+from pathlib import Path
+import _util as util
+import _preprocessing as preprocessing
+import _settings
+
+#parameters (see _settings.Settings) that change the output of the preprocessing
+PREPROCESSING_PARAMETERS = ['numberOfQuantiles', 'north', 'target_column', 'sampling_frequency', 'aggregation', 'compact_dtypes']
+#version of the output of the preprocessing: increase it when a change of _preprocessing.py changes its output
+#(e.g. new columns or data types), so that the datasets cached by previous versions are not used
+CACHE_VERSION = 1
+
+def preprocessing_cached(localisation_file, phases_file, _fill_NaN_Values, _include_all_data, cache_folder='cache', settings=None):
+	"""This function returns the preprocessed positioning dataset. If the same files were already preprocessed
+	with the same parameters, the dataset is loaded from the cache folder. Otherwise, the CSV files are opened,
+	preprocessed with _preprocessing.preprocessing() and the result is saved in the cache folder.
+
+	Parameters
+	----------
+	localisation_file : string
+		full filename of the csv file with the positioning datapoints (see _preprocessing.preprocessing())
+	phases_file : string
+		full filename of the csv file with the phases of each session (see _preprocessing.preprocessing())
+	_fill_NaN_Values: int
+		see _preprocessing.preprocessing()
+	_include_all_data : int
+		see _preprocessing.preprocessing()
+	cache_folder : string
+		folder where the preprocessed datasets are saved (optional, "cache" by default)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df : Pandas Data Frame
+		the preprocessed dataset returned by _preprocessing.preprocessing()
+
+	"""
+	settings = _settings.get_settings(settings)
+	parameters = {'_fill_NaN_Values': _fill_NaN_Values, '_include_all_data': _include_all_data}
+	key = get_cache_key([localisation_file, phases_file], parameters, settings)
+	cache_file = Path(cache_folder) / ('preprocessed_' + key + '.feather')
+
+	if cache_file.exists():
+		print ("Loading preprocessed dataset from cache: " + str(cache_file))
+		return read_cache(cache_file)
+
+	df = util.open_csv(localisation_file, ['timestamp'])
+	dfPhases = util.open_csv(phases_file, ['start', 'end'])
+	df2 = preprocessing.preprocessing(df, dfPhases, _fill_NaN_Values, _include_all_data, settings=settings)
+
+	write_cache(df2, cache_file)
+	print ("Preprocessed dataset saved in cache: " + str(cache_file))
+	return df2
+
+def get_cache_key(files, parameters, settings=None):
+	"""This function calculates the cache key of a list of files and parameters. The key changes if
+	the content of any file, any of the given parameters, any of the PREPROCESSING_PARAMETERS
+	of the settings or CACHE_VERSION change.
+
+	Parameters
+	----------
+	files : list of strings
+		full filenames of the input files
+	parameters : dict
+		other parameters that change the output (e.g. arguments of the preprocessing function)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	key : string
+		a SHA-256 hexadecimal digest
+
+	"""
+	sha = hashlib.sha256()
+	sha.update(('version=' + str(CACHE_VERSION) + '\n').encode('utf-8'))
+	for source_file in files:
+		with open(source_file, 'rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				sha.update(chunk)
+		sha.update(b'\0')
+
+	settings = _settings.get_settings(settings)
+	for name in PREPROCESSING_PARAMETERS:
+		sha.update((name + '=' + str(getattr(settings, name)) + '\n').encode('utf-8'))
+	for name in sorted(parameters):
+		sha.update((name + '=' + str(parameters[name]) + '\n').encode('utf-8'))
+	return sha.hexdigest()
+
+def read_cache(cache_file):
+	"""This function loads a cached preprocessed dataset. The file is memory-mapped and the numeric and 
+	datetime columns without missing values are not copied: they are read-only views of the mapped file, so they 
+	are only loaded from the disk when they are used. The other columns (booleans, strings, categories and columns 
+	with missing values) are copied into memory, as pandas cannot use the Arrow format of these columns.
+
+	Parameters
+	----------
+	cache_file : string
+		full filename of the Feather file
+
+	Returns
+	-------
+	df : Pandas Data Frame
+		the cached dataset
+
+	"""
+	from pyarrow import feather
+	table = feather.read_table(str(cache_file), memory_map=True)
+	#one block per column, so that the columns are not copied to consolidate them in blocks of the same type
+	return table.to_pandas(split_blocks=True)
+
+def write_cache(df, cache_file):
+	"""This function saves a preprocessed dataset as a Feather file. The file is written
+	to a temporary file first so that an interrupted run does not leave a corrupted cache.
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		the preprocessed dataset
+	cache_file : string
+		full filename of the Feather file
+
+	"""
+	from pyarrow import feather
+	cache_file = Path(cache_file)
+	cache_file.parent.mkdir(parents=True, exist_ok=True)
+	temporary_file = cache_file.with_name(cache_file.name + '.tmp')
+	feather.write_feather(df.reset_index(drop=True), str(temporary_file))
+	os.replace(str(temporary_file), str(cache_file))
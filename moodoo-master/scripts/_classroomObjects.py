@@ -18,9 +18,12 @@ functions:
 	* calculate_gini_trackers_together (main) - processes the data frame returned by the function 
 		generate_fixed_points_stats and calculates the index for all trackers together
 	* gini (auxiliar)- function to calculate gini index of a SERIES  - numpy array
-	* get_closer_fixedpoint_stop - auxiliar function to identify which fixed point is the closest to a stop
+	* segmented_gini (auxiliar) - function to calculate the gini index of many groups of a data frame at once
+	* get_closer_fixedpoint_stop - auxiliar function to identify which fixed point is the closest to a stop (KD-tree per session)
+	* generate_zone_stats (main) - to create a data frame with the time each tracker was inside each polygon zone 
+		(e.g. desks, teacher podium, doorway) and the stops inside it, by session, tracker and phase
+	* get_points_in_zones - auxiliar function to identify the polygon zones that contain each datapoint or stop
 """
-import configparser
 import numpy as np 
 import pandas as pd 
 import math
@@ -28,23 +31,22 @@ import datetime
 from dateutil import parser
 import time
 import _util as util
-#load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+import _settings
+import _stopsAndTransitions as stopsAndTransitions
 
-def generate_fixed_points_stats(df_stops_transitions,df_fixed_points):
+def generate_fixed_points_stats(df_stops_transitions,df_fixed_points,settings=None):
 	"""This function creates a data frame with the time each tracker was close to a fixed point
 		This can be used to calculate the gini index if only student fixed points are selected.
 		This can also serve to generate metrics about fixed points in the classroom.
 	
-	This function reads the following parameters from the configuration file:
+	This function reads the following parameters from the settings:
 	distance_tracker_fixed_point
 	
 	Parameters
 	----------
-	df_stops_transitions : Pandas Data Frame
+	df_stops_transitions : Pandas Data Frame or Segments
 		The output from _stopsAndTransitions.get_stops_and_transitions() function
-		This is: a data frame of stops and transitions
+		This is: a data frame of stops and transitions (or its Segments, if segments=True)
 		
 	df_fixed_points : Pandas Data Frame 
 		Containing the coordinates of fixed objects in the classroom for each particular session.
@@ -53,10 +55,18 @@ def generate_fixed_points_stats(df_stops_transitions,df_fixed_points):
 		tag (string) name of the fixed object or position
 		x,y (coordinates)
 		
-		It can contain the following columns (not yet used in the calculations)
-		time_start (datetime as "%Y-%m-%d_%H:%M:%S")
 		obj_type (string) type of fixed object or position (e.g. "zone") The output from _stopsAndTransitions.get_stops_and_transitions() function
 		
+		It can contain the following columns, for fixed points that change during a session (e.g. tables moved
+		between phases):
+		time_start (datetime as "%Y-%m-%d_%H:%M:%S")
+		time_end (datetime as "%Y-%m-%d_%H:%M:%S")
+		If the column time_end exists, each fixed point is only valid from time_start (included) to time_end 
+		(excluded) and the stops are compared with the fixed points that are valid when they start (empty 
+		values mean from the beginning or until the end of the session). Otherwise, time_start is not used.
+		The same tag can have several rows with different coordinates and times.
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -77,86 +87,39 @@ def generate_fixed_points_stats(df_stops_transitions,df_fixed_points):
 			type (string) "stop" in all cases
 	"""
 	print ("Generating fixed-points related stats...")
-	#Select  only stops from the df_stops_transitions dataframe
-	df1_fix = df_stops_transitions[['tracker', 'session','block','x','y','x_stdev','y_stdev','max_duration','type','timestamp']] # select columns
-	df1_fix = df1_fix.rename({'x': 'x_mean', 'y': 'y_mean'}, axis='columns')
-	df1_fix = df1_fix[df1_fix['type'] == 'stop']
-
-	#Merge datasets to obtain all the potential combinations between stops and fixed objects
-	merge = pd.merge(df1_fix, df_fixed_points, on='session')
-
-	#Calculate euclidian distances
-	merge['dist_student'] = np.sqrt((merge['x_mean'] - merge['x']) ** 2 + (merge['y_mean'] - merge['y']) ** 2)
-
-	#Simplifying output data frame
-	merge = merge[['block', 'tracker', 'session', 'tag', 'dist_student', 'timestamp']]
-	obj_types = []
-	for index, row_df in merge.iterrows():
-		data=df_fixed_points.loc[(df_fixed_points['session'] ==row_df['session']) & (df_fixed_points['tag'] == row_df['tag'])]
-		obj_types.append(data['obj_type'].values[0])
-	merge['obj_type'] = obj_types
-	
-	df_dist=merge
-	#df_dist includes distances between each  "stop" (associated to each tracker) 
-	#	and each fixed object (coordinate). It contains the following columns:
-	#		block - (int) the unique identifier of the stop 
-	#		session (identifier)
-	#		tracker (identifier)
-	#		x and y (coordinates)
-	#		tag (string) name of the fixed object or position
-	#		dist_student (distance between the stop and the object in milimeters)
-	#		time_start (datetime as "%Y-%m-%d_%H:%M:%S")
-	
-	df_stops_transitions.sort_values(by=['session'], inplace=True)
-	
+	if isinstance(df_stops_transitions, stopsAndTransitions.Segments):
+		#only the stops are used
+		df_stops_transitions = df_stops_transitions.stops()
 	# Create structure with stops only
 	stops = df_stops_transitions.loc[(df_stops_transitions['type'] == 'stop')][['block','session','tracker','timestamp','phase','quantile','max_duration_sec','x','y','type']]
-	stops.set_index("block", inplace = True) 
-	stops.sort_values(by=['session'], inplace=True)
-	stops
-
-	# identify closest fixed point to each stop
-	df_min_dis=get_closer_fixedpoint_stop(df_dist,stops)
 
-
-	# Remove distances over the parameter distance_tracker_fixed_point
-	distance_tracker_fixed_point= float(config.get('parameters','distance_tracker_fixed_point'))
-	df_min_dis = df_min_dis.loc[(df_min_dis['dist_student'] <= distance_tracker_fixed_point)]
+	# identify closest fixed point to each stop (only the stops closer than the parameter distance_tracker_fixed_point)
+	distance_tracker_fixed_point= _settings.get_settings(settings).distance_tracker_fixed_point
+	df_min_dis=get_closer_fixedpoint_stop(stops,df_fixed_points,distance_tracker_fixed_point)
 
 	# Calculate total time dedicated to each group of stduents
-	summary=df_min_dis.groupby(['session','tracker','phase','tag'])['max_duration_sec'].agg(['sum','count'])
+	summary=df_min_dis.groupby(['session','tracker','phase','tag'], observed=True)['max_duration_sec'].agg(['sum','count'])
 	summary.reset_index(inplace=True)
 
 	# Select only "student" points from the list of ALL fixed ppints
 	#df_fixed_points = df_fixed_points.loc[(df_fixed_points['obj_type'] == 'student')]
 
-	##Create structure that will hold SUMMARY data frame plus the fixed trackers that were never visited. 
-	col_names =  ['session', 'tracker', 'phase', 'tag', 'sum','count','type']
-	df_fixed_points_stats  = pd.DataFrame(columns = col_names)
+	##Create structure that will hold SUMMARY data frame plus the fixed trackers that were never visited: 
+	##one row per fixed point, phase and tracker of each session (phases and trackers with stops in that session)
+	phases = summary[['session','phase']].drop_duplicates()
+	trackers = summary[['session','tracker']].drop_duplicates()
+	df_fixed_points_stats = df_fixed_points[['session','tag','obj_type']].drop_duplicates().merge(phases, on='session').merge(trackers, on='session')
 
-	summary.reset_index(drop=True)
-	for index_fix, row_fixed in df_fixed_points.iterrows():
-		phases= summary.loc[(summary['session'] == row_fixed['session'])]['phase'].drop_duplicates()
-		trackers= summary.loc[(summary['session'] == row_fixed['session'])]['tracker'].drop_duplicates()
-		
-		for i1, ph in phases.items():
-			for i2, tr in trackers.items():
-				df_fixed_points_stats=df_fixed_points_stats.append({'session':row_fixed['session'],'tracker':tr,'phase':ph,'tag':row_fixed['tag'],'sum':0.0,'count':0.0,'obj_type':row_fixed['obj_type']}, ignore_index=True)
-
-	for index_sum, r_sum in summary.iterrows():    
-		for index_g, r_gini in df_fixed_points_stats.iterrows(): 
-			if (r_sum['session']==r_gini['session'] and r_sum['tracker']==r_gini['tracker'] and 
-			   r_sum['phase']==r_gini['phase'] and 
-				r_sum['tag']==r_gini['tag']):
-				df_fixed_points_stats.loc[index_g, 'sum'] = r_sum['sum']
-				df_fixed_points_stats.loc[index_g, 'count'] = r_sum['count']
-				r_gini['sum']=r_sum['sum']
-				r_gini['count']=r_sum['count']
+	# Add the time and number of stops of each fixed point (zero if it was never visited)
+	df_fixed_points_stats = df_fixed_points_stats.merge(summary, on=['session','tracker','phase','tag'], how='left')
+	df_fixed_points_stats[['sum','count']] = df_fixed_points_stats[['sum','count']].fillna(0.0)
+	df_fixed_points_stats['type'] = np.nan
+	df_fixed_points_stats = df_fixed_points_stats[['session', 'tracker', 'phase', 'tag', 'sum','count','type','obj_type']]
 				
 	print ("Fixed points stas generation COMPLETED")
 	return (df_fixed_points_stats)
 
-def calculate_gini_by_tracker(df_fixed_points_stats):
+def calculate_gini_by_tracker(df_fixed_points_stats,column='count'):
 	"""This function processes the data frame returned by the function 
 		generate_fixed_points_stats and calculates the index of dispersion by tracker
 		
@@ -176,6 +139,9 @@ def calculate_gini_by_tracker(df_fixed_points_stats):
 			quantile (int)
 			obj_type (string) student and zones
 			type (string) "stop" in all cases
+	column : string
+		'count' to calculate the index of the number of visits to each student fixed point or 'sum' to 
+		calculate it of the time spent close to them (optional, 'count' by default)
 		
 	Returns
 	-------
@@ -191,12 +157,12 @@ def calculate_gini_by_tracker(df_fixed_points_stats):
 	# Select only stops closer to a student
 	df_gini = df_fixed_points_stats.loc[(df_fixed_points_stats['obj_type'] == 'student')]
 	#CALCULATE GINI INDEX by session, tracker and phase
-	gini_output_separate_trackers=df_gini.groupby(['session','tracker','phase'])['count'].agg([gini])
+	gini_output_separate_trackers=segmented_gini(df_gini, ['session','tracker','phase'], column)
 	
 	print ("Gini index by tracker COMPLETED")
 	return (gini_output_separate_trackers)
 
-def calculate_gini_trackers_together(df_fixed_points_stats):
+def calculate_gini_trackers_together(df_fixed_points_stats,column='count'):
 	"""This function processes the data frame returned by the function generate_fixed_points_stats
 		grouped by session and phase (all trackers together)
 	Parameters
@@ -215,6 +181,9 @@ def calculate_gini_trackers_together(df_fixed_points_stats):
 			quantile (int)
 			obj_type (string) student and zones
 			type (string) "stop" in all cases
+	column : string
+		'count' to calculate the index of the number of visits to each student fixed point or 'sum' to 
+		calculate it of the time spent close to them (optional, 'count' by default)
 		
 	Returns
 	-------
@@ -229,7 +198,7 @@ def calculate_gini_trackers_together(df_fixed_points_stats):
 	# Select only stops closer to a student
 	df_gini = df_fixed_points_stats.loc[(df_fixed_points_stats['obj_type'] == 'student')]
 	#CALCULATE GINI INDEX by session and phase (all trackers together)
-	gini_output_joint_trackers=df_gini.groupby(['session','phase'])['count'].agg([gini])
+	gini_output_joint_trackers=segmented_gini(df_gini, ['session','phase'], column)
 	
 	print ("Gini index for all trackers COMPLETED")
 	return (gini_output_joint_trackers)
@@ -246,76 +215,272 @@ def gini(array):
 	-------
 	gini coefficient (float)
 	"""
-    #Roberto added this line 
-    array=array.as_matrix(columns=None)#<-------there is a warning here
-    # based on bottom eq:
-    # http://www.statsdirect.com/help/generatedimages/equations/equation154.svg
-    # from:
-    # http://www.statsdirect.com/help/default.htm#nonparametric_methods/gini.htm
-    # All values are treated equally, arrays must be 1d:
-    array = array.flatten()
-    if np.amin(array) < 0:
-        # Values cannot be negative:
-        array -= np.amin(array)
-    # Values cannot be 0:
-    array += 0.0000001
-    # Values must be sorted:
-    array = np.sort(array)
-    # Index per array element:
-    index = np.arange(1,array.shape[0]+1)
-    # Number of array elements:
-    n = array.shape[0]
-    # Gini coefficient:
-    return ((np.sum((2 * index - n  - 1) * array)) / (n * np.sum(array)))
+    values = np.array(array, dtype=np.float64).flatten()
+    return _segmented_gini(np.zeros(len(values), dtype=np.int64), values, 1)[0]
+
+def segmented_gini(df, keys, column):
+	"""This function calculates the Gini coefficient of a column for each group of rows (see gini). The values 
+	of all the groups are sorted once and the coefficients are calculated with cumulative sums, instead of 
+	calling the function gini for each group.
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		a data frame with the columns keys and column
+	keys : list of strings
+		columns that identify each group (e.g. ['session','tracker','phase'])
+	column : string
+		column with the values (e.g. 'count' or 'sum' of the output of generate_fixed_points_stats)
+
+	Returns
+	-------
+	df_gini : Pandas Data Frame
+		returns a data frame with the keys as index and the column:
+			gini (float) the Gini coefficient of each group
+	"""
+	grouped = df.groupby(keys, observed=True, sort=True)
+	index = grouped.size().index
+	codes = grouped.ngroup()
+	#rows with missing keys do not belong to any group (NaN or -1, depending on the version of pandas)
+	selected = (codes.notna() & (codes >= 0)).values
+	coefficients = _segmented_gini(codes.values[selected].astype(np.int64), df[column].values[selected].astype(np.float64), len(index))
+	return pd.DataFrame({'gini': coefficients}, index=index)
+
+def _segmented_gini(codes, values, groups):
+	"""This function calculates the Gini coefficient of the values of each group (codes from 0 to groups-1) in 
+	one pass: the values are sorted by group and value, and the sums of each group are calculated with reduceat"""
+	coefficients = np.full(groups, np.nan)
+	if len(values)==0:
+		return coefficients
+	order = np.lexsort((values, codes))
+	codes = codes[order]
+	values = values[order]
+	starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+	n = np.diff(np.append(starts, len(values)))
+	# based on bottom eq:
+	# http://www.statsdirect.com/help/generatedimages/equations/equation154.svg
+	# from:
+	# http://www.statsdirect.com/help/default.htm#nonparametric_methods/gini.htm
+	# Values cannot be negative (the minimum of each group is the first value):
+	minimum = np.repeat(values[starts], n)
+	values = np.where(minimum < 0, values - minimum, values)
+	# Values cannot be 0:
+	values = values + 0.0000001
+	# Index per array element (within its group) and number of array elements:
+	index = np.arange(len(values)) - np.repeat(starts, n) + 1
+	size = np.repeat(n, n)
+	# Gini coefficient:
+	coefficients[codes[starts]] = np.add.reduceat((2 * index - size - 1) * values, starts) / (n * np.add.reduceat(values, starts))
+	return coefficients
 	
-def get_closer_fixedpoint_stop(df_dist,df_stops):
-	"""This function merges dataframes of stops and distances between stops and fixed points.
-	It returns a list of stops with the closest fixed point to it and the distance to it.
+def get_closer_fixedpoint_stop(df_stops,df_fixed_points,max_distance=np.inf):
+	"""This function identifies the closest fixed point to each stop (of the same session) and the distance to it.
+	The fixed points of each session are indexed in a KD-tree, so the closest fixed point of all the stops of a 
+	session is found with one query (without calculating the distance between every stop and every fixed point).
 
 	Parameters
 	----------
-	df_dist : Pandas Data Frame
-		The output from calculate_distances_trackers_objects() function in this script
-		This is includes distances between each  "stop" (associated to each tracker) 
-		and each fixed object (coordinate). It contains the following columns:
-			block - (int) the unique identifier of the stop 
-			session (identifier)
-			tracker (identifier)
-			x and y (coordinates)
-			tag (string) name of the fixed object or position
-			dist_student (distance between the stop and the object in milimeters)
-			time_start (datetime as "%Y-%m-%d_%H:%M:%S")
-		
 	df_stops : Pandas Data Frame
-		This is: a data frame of stops and transitions
+		The stops (one row each) from the output of _stopsAndTransitions.get_stops_and_transitions() with 
+		the following columns: block, session, tracker, timestamp, phase, quantile, max_duration_sec, x, y and type
+	df_fixed_points : Pandas Data Frame 
+		the coordinates of the fixed objects in the classroom (see generate_fixed_points_stats)
+	max_distance : float
+		stops farther than this distance (in milimeters) from all the fixed points are not returned
+		(optional, all the stops by default)
 
 	Returns
 	-------
 	merge
-		returns a data frame with the following selected columns from the merge
+		returns a data frame with the following columns
 			block - (int) the unique identifier of the stop 
 			session (identifier)
 			tracker (identifier)
-			x and y (coordinates)
 			tag (string) name of the fixed object or position
 			dist_student (distance between the stop and the object in milimeters)
 			timestamp (datetime as "%Y-%m-%d_%H:%M:%S")
-			max_duration_sec (float) duration of the stop in secons
+			obj_type (string) "student" and "zone"
 			phase (int)
 			quantile (int)
-			obj_type (string) "student" in all cases
+			max_duration_sec (float) duration of the stop in secons
+			x and y (coordinates of the stop)
 			type (string) "stop" in all cases
 	"""
-	### Select row with minimum distance to a fixed object grouped by block, tracker, session
-	df_min_dis=df_dist[df_dist['dist_student'].isin(df_dist.groupby(('block','tracker','session')).min()['dist_student'].values)]
-	# sort Brand - ascending order
-	df_min_dis.sort_values(by=['session'], inplace=True)
+	from scipy.spatial import cKDTree
+	columns = ['block','session','tracker','tag','dist_student','timestamp','obj_type','phase','quantile','max_duration_sec','x','y','type']
+	#the limit of the KD-tree query excludes the points at exactly that distance
+	upper_bound = np.nextafter(max_distance, np.inf)
+
+	results = []
+	time_varying = 'time_end' in df_fixed_points.columns
+	fixed_points = dict(tuple(df_fixed_points.groupby('session', sort=False, observed=True)))
+	for session, stops in df_stops.groupby('session', sort=True, observed=True):
+		if session not in fixed_points:
+			continue
+		points = fixed_points[session]
+		#one KD-tree per time slice in which the same fixed points are valid (only one if they do not change)
+		if time_varying:
+			slices, valid = _time_slices(points, stops['timestamp'])
+		else:
+			slices = np.zeros(len(stops), dtype=np.int64)
+			valid = lambda time_slice: np.ones(len(points), dtype=bool)
+		for time_slice in np.unique(slices):
+			valid_points = points.loc[valid(time_slice)]
+			if len(valid_points)==0:
+				continue
+			slice_stops = stops.loc[slices == time_slice]
+			tree = cKDTree(valid_points[['x', 'y']].values.astype(np.float64))
+			distances, nearest = tree.query(slice_stops[['x', 'y']].values.astype(np.float64), k=1, distance_upper_bound=upper_bound)
+			#stops without any fixed point closer than max_distance get an infinite distance
+			found = np.isfinite(distances)
+			slice_stops = slice_stops.loc[found].assign(
+				tag=valid_points['tag'].values[nearest[found]],
+				dist_student=distances[found],
+				obj_type=valid_points['obj_type'].values[nearest[found]])
+			results.append(slice_stops[columns])
+
+	if not results:
+		return pd.DataFrame(columns=columns)
+	return pd.concat(results, ignore_index=True)
 
+def _time_slices(points, timestamps):
+	"""This function splits the time of a session at the time_start and time_end of its fixed points, so that the 
+	same fixed points are valid during each time slice. It returns the time slice of each timestamp (found with a 
+	binary search) and a function that returns the fixed points (boolean array) that are valid in a time slice"""
+	never = np.iinfo(np.int64).min
+	always = np.iinfo(np.int64).max
+	#empty values (NaT) mean from the beginning or until the end of the session
+	start = _nanoseconds(points['time_start']) if 'time_start' in points.columns else np.full(len(points), never)
+	end = _nanoseconds(points['time_end'])
+	end = np.where(end == never, always, end)
 
-	#Merge both dataframes to identify what fixed point is the closest to a stop
-	merge = pd.merge(df_min_dis, df_stops, on=['tracker','session','block'])
-	merge = merge[['block','session','tracker','tag','dist_student','timestamp_x','obj_type','phase','quantile','max_duration_sec','x','y','type']]
-	merge = merge.rename({'timestamp_x': 'timestamp'}, axis='columns')
-	return (merge)
+	boundaries = np.unique(np.concatenate([start[start != never], end[end != always]]))
+	slices = np.searchsorted(boundaries, _nanoseconds(timestamps), side='right')
+	#every time of a slice is valid for the same fixed points as its first time
+	first_times = np.concatenate([[never], boundaries])
+	valid = lambda time_slice: (start <= first_times[time_slice]) & (first_times[time_slice] < end)
+	return slices, valid
+
+def _nanoseconds(timestamps):
+	"""This function returns the timestamps as nanoseconds (NaT are the minimum int64)"""
+	return pd.to_datetime(timestamps).values.astype('datetime64[ns]').view(np.int64)
+
+def generate_zone_stats(df_preprocessed,df_zones,df_stops_transitions=None,settings=None):
+	"""This function creates a data frame with the time each tracker was inside each polygon zone of the classroom
+		(e.g. desks, teacher podium, doorway). Unlike the fixed points of type 'zone', which are single points (the 
+		closest one to each stop), a datapoint or stop is in a zone if it is inside its polygon.
 	
-	
\ No newline at end of file
+	This function reads the following parameters from the settings:
+	sampling_frequency
+	
+	Parameters
+	----------
+	df_preprocessed : Pandas Data Frame
+		the preprocessed dataset (see _preprocessing.preprocessing) with at least the following columns:
+			session (identifier)
+			tracker (identifier)
+			x and y (coordinates)
+			phase (int)
+	df_zones : Pandas Data Frame 
+		Containing the polygons of the zones of the classroom for each particular session, with one row per 
+		vertex of each polygon (in the order of the polygon) and the following columns:
+		session (identifier)
+		tag (string) name of the zone
+		x,y (coordinates of the vertex)
+	df_stops_transitions : Pandas Data Frame or Segments
+		The output from _stopsAndTransitions.get_stops_and_transitions() function (optional). If provided, 
+		the number of stops and the time of the stops inside each zone are also calculated
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df_zone_stats
+		returns a data frame with one row per zone, tracker and phase of each session (zero if the tracker 
+		was never inside the zone), with the following columns:
+			session (identifier)
+			tracker (identifier)
+			phase (int)
+			tag (string) name of the zone
+			samples (int) number of datapoints inside the zone
+			time_in_zone_sec (float) time inside the zone in seconds
+			stops (int) number of stops inside the zone (only if df_stops_transitions is provided)
+			stops_time_sec (float) duration of the stops inside the zone in seconds (only if 
+				df_stops_transitions is provided)
+	"""
+	print ("Generating zone related stats...")
+	seconds_per_sample = _settings.get_settings(settings).sampling_frequency.total_seconds()
+	keys = ['session','tracker','phase','tag']
+
+	# Time inside each zone (every datapoint represents one sample of time)
+	df_in_zones = get_points_in_zones(df_preprocessed[['session','tracker','phase','x','y']], df_zones)
+	summary = df_in_zones.groupby(keys, observed=True).size().rename('samples').reset_index()
+	summary['time_in_zone_sec'] = summary['samples'] * seconds_per_sample
+
+	# Structure with one row per zone, phase and tracker of each session (also the zones that were never visited)
+	df_zone_stats = df_zones[['session','tag']].drop_duplicates().merge(
+		df_preprocessed[['session','tracker','phase']].drop_duplicates(), on='session')
+	df_zone_stats = df_zone_stats.merge(summary, on=keys, how='left')
+	columns = ['samples','time_in_zone_sec']
+
+	# Stops whose centroid is inside each zone
+	if df_stops_transitions is not None:
+		if isinstance(df_stops_transitions, stopsAndTransitions.Segments):
+			df_stops_transitions = df_stops_transitions.stops()
+		stops = df_stops_transitions.loc[(df_stops_transitions['type'] == 'stop')][['session','tracker','phase','max_duration_sec','x','y']]
+		df_stops_in_zones = get_points_in_zones(stops, df_zones)
+		stops_summary = df_stops_in_zones.groupby(keys, observed=True)['max_duration_sec'].agg(['count','sum'])
+		stops_summary = stops_summary.rename(columns={'count': 'stops', 'sum': 'stops_time_sec'}).reset_index()
+		df_zone_stats = df_zone_stats.merge(stops_summary, on=keys, how='left')
+		columns = columns + ['stops','stops_time_sec']
+
+	df_zone_stats[columns] = df_zone_stats[columns].fillna(0)
+	for column in ['samples','stops']:
+		if column in columns:
+			df_zone_stats[column] = df_zone_stats[column].astype(np.int64)
+	df_zone_stats = df_zone_stats[['session','tracker','phase','tag'] + columns]
+
+	print ("Zone stats generation COMPLETED")
+	return (df_zone_stats)
+
+def get_points_in_zones(df,df_zones):
+	"""This function identifies the polygon zones (of the same session) that contain each datapoint or stop.
+	The points of each session are classified with one call per zone (matplotlib.path.Path.contains_points), 
+	only for the points inside the bounding box of the zone.
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		datapoints or stops with at least the columns session, x and y
+	df_zones : Pandas Data Frame 
+		the polygons of the zones of the classroom (see generate_zone_stats)
+
+	Returns
+	-------
+	df_in_zones
+		returns a data frame with the rows of df that are inside a zone (one row per zone if the zones overlap)
+		and the column:
+			tag (string) name of the zone
+	"""
+	from matplotlib.path import Path
+	columns = list(df.columns) + ['tag']
+
+	results = []
+	zones = dict(tuple(df_zones.groupby('session', sort=False, observed=True)))
+	for session, points in df.groupby('session', sort=True, observed=True):
+		if session not in zones:
+			continue
+		xy = points[['x', 'y']].values.astype(np.float64)
+		for tag, vertices in zones[session].groupby('tag', sort=False, observed=True):
+			vertices = vertices[['x', 'y']].values.astype(np.float64)
+			(x_min, y_min), (x_max, y_max) = vertices.min(axis=0), vertices.max(axis=0)
+			#only the points inside the bounding box can be inside the polygon
+			candidates = np.flatnonzero((xy[:, 0] >= x_min) & (xy[:, 0] <= x_max) & (xy[:, 1] >= y_min) & (xy[:, 1] <= y_max))
+			if len(candidates)==0:
+				continue
+			inside = candidates[Path(vertices, closed=False).contains_points(xy[candidates])]
+			results.append(points.iloc[inside].assign(tag=tag))
+
+	if not results:
+		return pd.DataFrame(columns=columns)
+	return pd.concat(results, ignore_index=True)[columns]
@@ -14,7 +14,6 @@ functions:
 	* plot_charts_per_tracker - This function generates Voronoi, ConvexHull and Delaunay charts in the folder "output_figures"
 		per tracker.
 """
-import configparser
 import numpy as np 
 import pandas as pd 
 from scipy.stats import entropy
@@ -27,17 +26,14 @@ import math
 import time
 import _util as util
 from pathlib import Path
+import _settings
 
-#load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
 
-
-def calculate_entropy_session_tracker_phase(df_dist):
+def calculate_entropy_session_tracker_phase(df_dist,settings=None):
 	"""This function generates a grid for each session, tracker and phase to calculate the entropy of that tracker
 	in each "phase". 
 
-	This function reads the following parameters from the configuration file:
+	This function reads the following parameters from the settings:
 	room_x
 	room_y
 	size_of_grid_cells
@@ -52,6 +48,8 @@ def calculate_entropy_session_tracker_phase(df_dist):
 			x and y (coordinates)
 			phase (int)
 			quantile (int) Set to 1 if not interested in using this column
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -66,16 +64,17 @@ def calculate_entropy_session_tracker_phase(df_dist):
 
 	"""
 	print ("Calculating entropy.")
-	# Read room dimensions and grid size from config file
-	room_x= float(config.get('parameters','room_x'))
-	room_y= float(config.get('parameters','room_y'))
-	size_of_grid_cells= float(config.get('parameters','size_of_grid_cells'))
+	# Read room dimensions and grid size from the settings
+	settings = _settings.get_settings(settings)
+	room_x= settings.room_x
+	room_y= settings.room_y
+	size_of_grid_cells= settings.size_of_grid_cells
 
 	# Calculate number of columns and rows
 	n_gridsquares = int(round(room_x/size_of_grid_cells,0))
 	m_gridsquares = int(round(room_y/size_of_grid_cells,0))
 
-	distinct_phase_quartile=df_dist.groupby(['session','tracker','phase']).size().reset_index().rename(columns={0:'count'})
+	distinct_phase_quartile=df_dist.groupby(['session','tracker','phase'], observed=True).size().reset_index().rename(columns={0:'count'})
 
 	# Create a proportional grid for each session, tracker and phase 
 	grids = []
@@ -130,11 +129,11 @@ def calculate_entropy_session_tracker_phase(df_dist):
 
 
 
-def calculate_entropy_session_tracker(df_dist):
+def calculate_entropy_session_tracker(df_dist,settings=None):
 	"""This function generates a grid for each session and tracker to calculate the entropy of that tracker
 	for the whole dataset. 
 
-	This function reads the following parameters from the configuration file:
+	This function reads the following parameters from the settings:
 	room_x
 	room_y
 	size_of_grid_cells
@@ -149,6 +148,8 @@ def calculate_entropy_session_tracker(df_dist):
 			x and y (coordinates)
 			phase (int)
 			quantile (int) Set to 1 if not interested in using this column
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -163,10 +164,11 @@ def calculate_entropy_session_tracker(df_dist):
 
 	"""
 	print ("Calculating entropy.")
-	# Read room dimensions and grid size from config file
-	room_x= float(config.get('parameters','room_x'))
-	room_y= float(config.get('parameters','room_y'))
-	size_of_grid_cells= float(config.get('parameters','size_of_grid_cells'))
+	# Read room dimensions and grid size from the settings
+	settings = _settings.get_settings(settings)
+	room_x= settings.room_x
+	room_y= settings.room_y
+	size_of_grid_cells= settings.size_of_grid_cells
 
 	# Calculate number of columns and rows
 	n_gridsquares = int(round(room_x/size_of_grid_cells,0))
@@ -179,7 +181,7 @@ def calculate_entropy_session_tracker(df_dist):
 	session = df_block.session.unique()
 
 	# Get session tracker pairs
-	pairs_session_tracker=df_dist.groupby(['session','tracker']).size().reset_index().rename(columns={0:'count'})
+	pairs_session_tracker=df_dist.groupby(['session','tracker'], observed=True).size().reset_index().rename(columns={0:'count'})
 
 
 	# Create a grid for each session and tracker 
@@ -265,7 +267,7 @@ def get_entropy(df):
 	return df
 	
 	
-def plot_charts_per_tracker(df_stops_transitions):
+def plot_charts_per_tracker(df_stops_transitions,settings=None):
 	"""This function generates Voronoi, ConvexHull and Delaunay charts in the folder "output_figures"
 		per tracker.
 		
@@ -274,7 +276,9 @@ def plot_charts_per_tracker(df_stops_transitions):
 	----------
 	df_stops_transitions : Pandas Data Frame
 		The output from _stopsAndTransitions.get_stops_and_transitions() function
-		This is: a data frame of stops and transitions	
+		This is: a data frame of stops and transitions
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -284,18 +288,19 @@ def plot_charts_per_tracker(df_stops_transitions):
 	"""
 	print ("Plotting charts started")
 	#Load room dimensions
-	room_x= float(config.get('parameters','room_x'))
-	room_y= float(config.get('parameters','room_y'))
+	settings = _settings.get_settings(settings)
+	room_x= settings.room_x
+	room_y= settings.room_y
 
 	#Load position of the coordinate 0,0
-	HorizonalZero= str(config.get('parameters','HorizonalZero'))
-	VerticalZero= str(config.get('parameters','VerticalZero'))
+	HorizonalZero= settings.HorizonalZero
+	VerticalZero= settings.VerticalZero
 
 	# Create structure with stops only
 	stops = df_stops_transitions.loc[(df_stops_transitions['type'] == 'stop')][['session','phase','quantile','tracker','x','y','max_duration_sec']]
 
 	##CREATE STRUCTURE THAT WILL HOLD THE DIAGRAMS PER PHASE
-	distinct_sessions_partitions=stops.groupby(['session','tracker','phase']).size().reset_index().rename(columns={0:'count'})
+	distinct_sessions_partitions=stops.groupby(['session','tracker','phase'], observed=True).size().reset_index().rename(columns={0:'count'})
 	#distinct_sessions_partitions.head(6)
 
 
@@ -9,7 +9,6 @@ environment you are running this script in.
 This file can also be imported as a module and contains the following functions:  
     * get_metrics (main function)- It extracts and merges all the metrics from the outputs of other scripts.
 """
-import configparser
 import numpy as np 
 import pandas as pd 
 #from sklearn import preprocessing
@@ -21,21 +20,24 @@ import math
 import time
 import datetime
 import _util as util
-#load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+import _settings
+import _stopsAndTransitions as stopsAndTransitions
+import _proximity as proximity
 
 
 
-def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,selectedPhase):
+def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,selectedPhase,settings=None,df_proximity=None,df_zone_stats=None):
 	"""This function generates a data frame that clusters data points according to their distance.  
 		The parameter "distance" is read from the config file and it is used to create a new cluster 
 		if the distance between two consecutive datapoints is higher than the parameter 'distance'
 	
 	Parameters
 	----------
-	df_fs : Pandas Data Frame
-		Data frame of stops and transitions returning from _stopsAndTransitions.stops_transitions()
+	df_fs : Pandas Data Frame or Segments
+		Data frame of stops and transitions returning from _stopsAndTransitions.stops_transitions() 
+		(or its Segments, if segments=True). If the transitions were simplified (see 
+		_stopsAndTransitions.simplify_transitions), the distance walked is calculated from the length of the 
+		original path (column path_dist), so it is the same as without simplification
 	df_points : Pandas Data Frame
 		Data frame of fixed_points_stats returning from _stopsAndTransitions.generate_fixed_points_stats()
 	df_entropy : Pandas Data Frame
@@ -56,7 +58,15 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 	
 	selectedPhase : (int)
 		if results from all the phases are to be included set to -99, otherwise, indicate the particular phase of interest (e.g. 1, 2, 3...)
-	
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+	df_proximity : Pandas Data Frame
+		Data frame of the proximity between pairs of trackers returning from _proximity.calculate_proximity_by_pair() 
+		(optional). If provided, the metrics Copresence_time_mins and Mean_distance_to_trackers_meter are added
+	df_zone_stats : Pandas Data Frame
+		Data frame of the time inside each polygon zone returning from _classroomObjects.generate_zone_stats() 
+		(optional). If provided, the metric Time_in_zone_min_<tag> is added for each zone
+
 	Returns
 	-------
 	Output
@@ -68,6 +78,11 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 
 	"""
 	print ("Calculating metrics.")
+	segments = None
+	if isinstance(df_fs, stopsAndTransitions.Segments):
+		#only the stops are needed as rows, the datapoints of the transitions are created below
+		segments = df_fs
+		df_fs = segments.stops()
 	#ADD COLUMN STOP DURATIONS IN MINUTES
 	durations= []
 	for index, row in df_fs.iterrows():
@@ -79,7 +94,7 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 
 
 	############ Extract metrics related to STOPS ############
-	df_stops=df_fs.loc[(df_fs['type'] == 'stop')].groupby(['session','tracker','phase']).agg(
+	df_stops=df_fs.loc[(df_fs['type'] == 'stop')].groupby(['session','tracker','phase'], observed=True).agg(
 	   Number_of_stops=pd.NamedAgg(column='duration_minutes', aggfunc='count'),
 	   Stopping_time_mins=pd.NamedAgg(column='duration_minutes', aggfunc=sum),
 	   Max_stop_mins=pd.NamedAgg(column='duration_minutes', aggfunc=max),
@@ -93,35 +108,49 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 	############ Extract metrics related to TRANSITIONS ############
 
 	#Add a column to calculate euclidean distance to the previous data point in a transition (to calculate distance walked and speed)
-	df_fs.sort_values(by=['session','tracker','block'], inplace=True)
-	distances= []
-	speed=[] 
-	prevRow=[]
-	for index, row in df_fs.iterrows():
-		if (len(prevRow)==0):
-		#First row of the dataset
-			prevRow=row
-			distances.append(0)
-		else:
-			if ((prevRow['session']==row['session']) 
-				& (prevRow['tracker']==row['tracker'])):
-				#CALCULATE DISTANCE
-				distances.append((np.sqrt((prevRow['x'] - row['x']) ** 2 + (prevRow['y'] - row['y']) ** 2))/1000)
+	if segments is not None:
+		df_distances = segments.transition_distances()
+	else:
+		df_fs.sort_values(by=['session','tracker','block'], inplace=True)
+		simplified = 'path_dist' in df_fs.columns
+		distances= []
+		speed=[] 
+		prevRow=[]
+		for index, row in df_fs.iterrows():
+			if (len(prevRow)==0):
+			#First row of the dataset
 				prevRow=row
-			else:
-				#It is a new session or tracker
 				distances.append(0)
-				prevRow=row
-	df_fs['distance_previous_point_meter'] = distances
-
-	#Extract metrics
-	transitions=df_fs.loc[(df_fs['type'] == 'transition')].groupby(['session','tracker','phase','block']).agg(
+			else:
+				if (simplified and (prevRow['session']==row['session']) 
+					& (prevRow['tracker']==row['tracker']) & (prevRow['block']==row['block'])):
+					#length of the original path of simplified transitions
+					distances.append(row['path_dist']/1000)
+					prevRow=row
+				elif ((prevRow['session']==row['session']) 
+					& (prevRow['tracker']==row['tracker'])):
+					#CALCULATE DISTANCE
+					distances.append((np.sqrt((prevRow['x'] - row['x']) ** 2 + (prevRow['y'] - row['y']) ** 2))/1000)
+					prevRow=row
+				else:
+					#It is a new session or tracker
+					distances.append(0)
+					prevRow=row
+		df_fs['distance_previous_point_meter'] = distances
+
+		df_distances = df_fs.loc[(df_fs['type'] == 'transition')]
+		if not simplified:
+			df_distances = df_distances.assign(path_points=1)
+
+	#Extract metrics (the speed is the mean distance between consecutive original datapoints)
+	transitions=df_distances.groupby(['session','tracker','phase','block'], observed=True).agg(
 	   Distance_walked=pd.NamedAgg(column='distance_previous_point_meter', aggfunc=sum),
-	   Speed_meter_per_sec=pd.NamedAgg(column='distance_previous_point_meter', aggfunc='mean')
+	   Number_of_points=pd.NamedAgg(column='path_points', aggfunc=sum)
 	)
+	transitions['Speed_meter_per_sec'] = transitions['Distance_walked'] / transitions['Number_of_points']
 	transitions.reset_index(inplace=True)
 
-	df_transitions=transitions.groupby(['session','tracker','phase']).agg(
+	df_transitions=transitions.groupby(['session','tracker','phase'], observed=True).agg(
 	   Number_of_transitions=pd.NamedAgg(column='block', aggfunc='count'),
 	   Distance_walked=pd.NamedAgg(column='Distance_walked', aggfunc=sum),
 	   Speed_meter_per_sec=pd.NamedAgg(column='Speed_meter_per_sec', aggfunc='mean')
@@ -136,7 +165,7 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 	df_points['total_attention_time_min'] = df_points['sum']/60
 
 	#Extract metrics related to student fixed positions
-	df_students=df_points.loc[(df_points['obj_type'] == 'student')].groupby(['session','tracker','phase']).agg(
+	df_students=df_points.loc[(df_points['obj_type'] == 'student')].groupby(['session','tracker','phase'], observed=True).agg(
 	  Total_attention_time_min=pd.NamedAgg(column='total_attention_time_min', aggfunc=sum),
 	  Total_number_visits=pd.NamedAgg(column='count', aggfunc=sum),
 	  Average_attention_time_per_visit=pd.NamedAgg(column='time_per_stop_min', aggfunc='mean'),
@@ -146,7 +175,7 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 	)
 
 	#Extract metrics related to object/zone fixed positions
-	df_objs=df_points.loc[(df_points['obj_type'] == 'zone')].groupby(['session','tracker','phase','tag']).agg(
+	df_objs=df_points.loc[(df_points['obj_type'] == 'zone')].groupby(['session','tracker','phase','tag'], observed=True).agg(
 	  Total_attention_time_min=pd.NamedAgg(column='total_attention_time_min', aggfunc=sum),
 	  Total_number_visits=pd.NamedAgg(column='count', aggfunc=sum),
 	)
@@ -154,29 +183,35 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 	df_objects = df_objs.pivot_table(
 			index=['session', 'tracker','phase'], 
 			 columns='tag', 
-			 values=["Total_attention_time_min","Total_number_visits"]).reset_index()
-
-	############ Extract metrics related to distance between moving trackers (pending) ############ TBC ############ 
-
-
-
-
+			 values=["Total_attention_time_min","Total_number_visits"], observed=True).reset_index()
 
+	#Extract metrics related to polygon zones (one column per zone)
+	if df_zone_stats is not None:
+		df_zone_stats = df_zone_stats.assign(Time_in_zone_min=df_zone_stats['time_in_zone_sec']/60)
+		df_zones = df_zone_stats.pivot_table(
+				index=['session', 'tracker','phase'], 
+				 columns='tag', 
+				 values='Time_in_zone_min', aggfunc='sum', observed=True)
+		df_zones.columns = ['Time_in_zone_min_' + str(tag) for tag in df_zones.columns]
+		df_zones.reset_index(inplace=True)
 
+	############ Extract metrics related to distance between moving trackers ############ 
+	if df_proximity is not None:
+		df_proximity=proximity.calculate_proximity_by_tracker(df_proximity)
 
 
 	############ Extract metrics related to ENTROPY ############ 
-	df_entropy=df_entropy.groupby(['session','tracker','phase']).agg(
+	df_entropy=df_entropy.groupby(['session','tracker','phase'], observed=True).agg(
 	  Entropy=pd.NamedAgg(column='entropy', aggfunc=sum)
 	)
 
 	############ Extract metrics related to DISPERSION (GINI INDEX) ############ 
-	df_giniT=df_giniT.groupby(['session','tracker','phase']).agg(
+	df_giniT=df_giniT.groupby(['session','tracker','phase'], observed=True).agg(
 	  gini=pd.NamedAgg(column='gini', aggfunc=sum)
 	)
 	df_giniT= df_giniT.rename({'gini': 'gini_per_tracker'}, axis=1)
 	############ Extract metrics related to DISPERSION (GINI INDEX) all trackers together ############ 
-	df_giniSession=df_giniSession.groupby(['session','phase']).agg(
+	df_giniSession=df_giniSession.groupby(['session','phase'], observed=True).agg(
 	  gini=pd.NamedAgg(column='gini', aggfunc=sum)
 	)
 	df_giniSession= df_giniSession.rename({'gini': 'gini_per_session'}, axis=1)
@@ -184,6 +219,12 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 
 	#############MERGE ALL######################
 	merge1 = pd.merge(df_stops, df_transitions, on=['session','tracker','phase'])
+	if df_proximity is not None:
+		#trackers that were alone in a session and phase were never close to other trackers
+		merge1 = pd.merge(merge1, df_proximity, on=['session','tracker','phase'], how='left')
+		merge1['Copresence_time_mins'] = merge1['Copresence_time_mins'].fillna(0)
+	if df_zone_stats is not None:
+		merge1 = pd.merge(merge1, df_zones, on=['session','tracker','phase'], how='left')
 	merge2 = pd.merge(df_students, df_objects, on=['session','tracker','phase'])
 	merge3 = pd.merge(df_entropy, df_giniT, on=['session','tracker','phase'])
 
@@ -199,7 +240,7 @@ def get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,sel
 		Output=Merge5		
 
 		
-	weighted= int(config.get('parameters','weighted'))		
+	weighted= _settings.get_settings(settings).weighted
 	#Normalising output (wheightning)
 	if (weighted==1):
 		#Calculate duration of each phase in  seconds
@@ -1,7 +1,8 @@
 """Data preprocessing scripts
 
 This script allows the user to 
-i) Downsample the positioning dataset to 1HZ (1 data point per second), 
+i) Downsample the positioning dataset to 1HZ (1 data point per second) or to the sampling frequency set in the 
+	configuration file, aggregating all the datapoints of each time bucket, 
 ii) to interpolate the dataset to fill gaps in positioning sensing for more than 1 second, 
 iii) calculate rotation in degrees if 3D rotation information is provided (in radians),
 iv) add information about "phases" if a phases Data frame is provided, 
@@ -13,6 +14,10 @@ environment you are running this script in.
 This file can also be imported as a module and contains the following functions:
 
 	* preprocessing (main) - this functions calls all the functions below to preprocess the positioning dataset 
+	* preprocessing_parallel - this function preprocesses each session and tracker in a separate process
+	* IncrementalPreprocessing - class for preprocessing new chunks of positioning data (e.g. during a live study) 
+		and appending them to an already preprocessed dataset
+	* aggregate_samples - for aggregating high frequency positioning data into one datapoint per time bucket (mean, median or last)
     * sampling_and_interpolating - for (down) smapling and interpolating a positioning dataset
 	* add_rotation - this function adds a new column 'rotation' in degrees from pitch,roll or yaw in radians 
 	* calculate_rotation (auxiliar) - this function accepts angle in radians and generates the angle in degrees
@@ -21,20 +26,21 @@ This file can also be imported as a module and contains the following functions:
 		a phase in X number of equal parts according to their timestamp
 
 """
-import configparser
 import pandas as pd
 import math
 import numpy as np 
-#load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import _util as util
+import _settings
 
-def preprocessing(df,dfPhases,_fill_NaN_Values,_include_all_data):
+def preprocessing(df,dfPhases,_fill_NaN_Values,_include_all_data,_workers=1,settings=None):
 	"""This functions calls all the functions to preprocess the positioning dataset in the following order. 
-	1) add_phases
-	2) add_quantiles
-	3) add_rotation
-	4) sampling_and_interpolating
+	1) aggregate_samples
+	2) add_phases
+	3) add_quantiles
+	4) add_rotation
+	5) sampling_and_interpolating
 	
 	Use these functions separately if you need to skip any pre-procesisng step. 
 
@@ -63,15 +69,24 @@ def preprocessing(df,dfPhases,_fill_NaN_Values,_include_all_data):
 		If Fill NaN Values= 1 the rows that will be added as a result of interpolating x and y data
 		will be filled with data from previous rows. In doubt, set it to 1
 
+	_workers: int
+		Number of processes used to preprocess the dataset (optional, 1 by default). If it is higher than 1
+		each session and tracker is preprocessed in parallel (see preprocessing_parallel)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
 	Returns
 	-------
 	df2 : Pandas Data Frame
 		a downsampled Pandas dataset (to 1 hz). If other columns are present the new rows created as a result 
 		of the interpolation copy the same values as the previous row. 
+		If the parameter compact_dtypes is 1, the columns are converted with _util.compact_dtypes(). 
+		If the parameter memory_report is 1, the memory footprint of each preprocessing step is printed and 
+		saved in df2.attrs['memory_report'] as a tuple of (stage, rows, columns, memory_MB) rows.
 		
 		New columns: 
-			interpolated : int (A new Interpolated column is added to indicate with 1 if a row was inserted; 
-				and 0 if the row was in the original dataset)
+			interpolated : boolean (A new Interpolated column is added to indicate with True if a row was inserted; 
+				and False if the row was in the original dataset)
 			rotation : float (rotation of the tracker in degreed (it can contain negative values with reference 
 				to the UPPER direction in the floorplan) 
 			phase : int 
@@ -79,32 +94,285 @@ def preprocessing(df,dfPhases,_fill_NaN_Values,_include_all_data):
 
 	"""
 	print ("Commencing preprocessing......")
-	#Add Phase column
+	settings = _settings.get_settings(settings)
+	#memory footprint of each step (only if the parameter memory_report is 1)
+	memory_report = [] if settings.memory_report==1 else None
+	util.add_memory_footprint(memory_report, 'input', df)
+	if (_workers>1):
+		df2=preprocessing_parallel(df,dfPhases,_fill_NaN_Values,_include_all_data,_workers,settings)
+		util.add_memory_footprint(memory_report, 'preprocessing_parallel', df2)
+	else:
+		#Aggregate datapoints into time buckets of the sampling frequency
+		df=aggregate_samples(df,settings)
+		util.add_memory_footprint(memory_report, 'aggregate_samples', df)
+		print ("Datapoints aggregated...")
+
+		#Add Phase column
+		df=add_phases(df,dfPhases,_include_all_data)
+		util.add_memory_footprint(memory_report, 'add_phases', df)
+		print ("Phases added...")
+		
+		#Add Quantiles column
+		df=add_quantiles(df,dfPhases,settings)
+		util.add_memory_footprint(memory_report, 'add_quantiles', df)
+		print ("Quantiles added...")
+
+		#Add column rotation to the DataFrame
+		df=add_rotation(df,settings)
+		util.add_memory_footprint(memory_report, 'add_rotation', df)
+		print ("Rotation in deggrees calculated...")
+
+		#Downsampling and interpolating
+		df2=sampling_and_interpolating(df,_fill_NaN_Values,settings)
+		util.add_memory_footprint(memory_report, 'sampling_and_interpolating', df2)
+		print ("Downsampling and interpolation completed")
+
+	#Convert to compact data types
+	if (settings.compact_dtypes==1):
+		df2=util.compact_dtypes(df2)
+		util.add_memory_footprint(memory_report, 'compact_dtypes', df2)
+
+	if memory_report is not None:
+		#the report is saved as a tuple of rows (pandas copies the attrs on every operation on the Data Frame)
+		df2.attrs['memory_report'] = tuple(tuple(step.values()) for step in memory_report)
+		print ("Memory footprint of each step:")
+		print (pd.DataFrame(memory_report).to_string(index=False))
+	print ("Preprocessing COMPLETED")
+	return (df2)
+
+def preprocessing_parallel(df,dfPhases,_fill_NaN_Values,_include_all_data,_workers,settings=None):
+	"""This function runs the same preprocessing steps as the function preprocessing, but it splits the
+	dataset by session and tracker and preprocesses each part in a pool of processes. 
+	The parts are merged in the order of session and tracker, so the result is the same as preprocessing 
+	the whole dataset in one process.
+
+	NOTE: on systems that start processes with "spawn" (Windows and macOS), the script that calls this 
+	function has to be protected with: if __name__ == '__main__':
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		A Localization DataFrame (see preprocessing)
+	dfPhases : Pandas Data Frame
+		a Data Frame with the phases of each session (see preprocessing)
+	_fill_NaN_Values: int
+		see preprocessing
+	_include_all_data : int
+		see preprocessing
+	_workers: int
+		Number of processes
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df2 : Pandas Data Frame
+		the preprocessed dataset (see preprocessing)
+
+	"""
+	settings = _settings.get_settings(settings)
+	parts = [part for key, part in df.groupby(['session','tracker'], sort=True, observed=True)]
+	if (len(parts)==0):
+		return _preprocess_part(df,dfPhases,_fill_NaN_Values,_include_all_data,settings)
+
+	chunksize = max(1, len(parts) // (_workers * 4))
+	with ProcessPoolExecutor(max_workers=_workers) as executor:
+		results = list(executor.map(_preprocess_part, parts, repeat(dfPhases), repeat(_fill_NaN_Values), 
+			repeat(_include_all_data), repeat(settings), chunksize=chunksize))
+	print ("Preprocessing of " + str(len(parts)) + " sessions and trackers completed")
+
+	df2 = pd.concat(results, ignore_index=True)
+	return df2
+
+def _preprocess_part(df,dfPhases,_fill_NaN_Values,_include_all_data,settings):
+	"""This function runs all the preprocessing steps on a part of the dataset (used by preprocessing_parallel)"""
+	df=aggregate_samples(df,settings)
 	df=add_phases(df,dfPhases,_include_all_data)
-	print ("Phases added...")
-	
-	#Add Quantiles column
-	df=add_quantiles(df,dfPhases)
-	print ("Quantiles added...")
+	df=add_quantiles(df,dfPhases,settings)
+	df=add_rotation(df,settings)
+	return sampling_and_interpolating(df,_fill_NaN_Values,settings)
 
-	#Add column rotation to the DataFrame
-	df=add_rotation(df)
-	print ("Rotation in deggrees calculated...")
+class IncrementalPreprocessing:
+	"""This class preprocesses new chunks of positioning data as they arrive (e.g. every few minutes 
+	during a live study) and appends them to the preprocessed dataset, instead of running the function 
+	preprocessing over the full history every time. The preprocessing steps are the same (see preprocessing).
 
-	#Downsampling and interpolating
-	df2=sampling_and_interpolating(df,_fill_NaN_Values)
-	print ("Downsampling and interpolation completed")
+	The last preprocessed datapoint of each session and tracker is kept and used as the starting point to 
+	interpolate the gap between the previous data and a new chunk. Phases and quantiles are only calculated 
+	for the new rows, so the cost of each update depends on the size of the chunk and not on the length of 
+	the session. If each chunk starts at a new time bucket (see aggregate_samples), the result is the same as 
+	preprocessing all the data at once.
 
-	print ("Preprocessing COMPLETED")
-	return (df2)
+	Datapoints of a chunk that are not after the last preprocessed datapoint of their session and tracker
+	(late datapoints) are ignored.
+
+		Example:
+			live = preprocessing.IncrementalPreprocessing(dfPhases, 1, 0)
+			new_rows = live.append(df_chunk)      # every time new data arrives
+			df2 = live.get_dataset()              # full preprocessed dataset
+
+	Parameters
+	----------
+	dfPhases : Pandas Data Frame
+		a Data Frame with the phases of each session (see preprocessing)
+	_fill_NaN_Values: int
+		see preprocessing
+	_include_all_data : int
+		see preprocessing
+	df_preprocessed : Pandas Data Frame
+		a dataset already preprocessed with the same parameters (optional, e.g. loaded with 
+		_cache.preprocessing_cached). New chunks are appended to it
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
-def sampling_and_interpolating(df,_fill_NaN_Values):
+	"""
+
+	def __init__(self,dfPhases,_fill_NaN_Values,_include_all_data,df_preprocessed=None,settings=None):
+		self.dfPhases = dfPhases
+		self.fill_NaN_Values = _fill_NaN_Values
+		self.include_all_data = _include_all_data
+		self.settings = _settings.get_settings(settings)
+		#preprocessed chunks (they are only concatenated when the dataset is requested)
+		self.chunks = []
+		#last preprocessed datapoint of each session and tracker: {(session, tracker): Data Frame with one row}
+		self.last_samples = {}
+		if df_preprocessed is not None and len(df_preprocessed)>0:
+			self._store(df_preprocessed)
+
+	def append(self,df):
+		"""This function preprocesses a new chunk of positioning data and appends it to the dataset
+
+		Parameters
+		----------
+		df : Pandas Data Frame
+			A Localization DataFrame with the new datapoints of one or more sessions and trackers 
+			(same columns as the data used by the function preprocessing)
+
+		Returns
+		-------
+		df2 : Pandas Data Frame
+			the new preprocessed rows (including the rows interpolated between the previous data and the chunk)
+
+		"""
+		keys = ['session','tracker']
+		settings = self.settings
+
+		df=aggregate_samples(df,settings)
+
+		#ignore late datapoints
+		previous = self._previous_timestamps(df)
+		df = df[previous.isna().values | (df['timestamp'].values > previous.values)]
+
+		df=add_phases(df,self.dfPhases,self.include_all_data)
+		df=add_quantiles(df,self.dfPhases,settings)
+		df=add_rotation(df,settings)
+		if (len(df)==0):
+			print ("No new datapoints to preprocess")
+			return df.assign(interpolated=pd.Series(dtype=bool))
+
+		#add the last datapoint of each session and tracker before the chunk to interpolate the gap
+		anchors = [self.last_samples[key][list(df.columns)] for key in df.groupby(keys, sort=False, observed=True).indices
+			if key in self.last_samples]
+		df2=sampling_and_interpolating(pd.concat(anchors + [df], ignore_index=True),self.fill_NaN_Values,settings)
+
+		#remove the datapoints that were already in the dataset
+		previous = self._previous_timestamps(df2)
+		df2 = df2[previous.isna().values | (df2['timestamp'].values > previous.values)].reset_index(drop=True)
+
+		if (settings.compact_dtypes==1):
+			df2=util.compact_dtypes(df2)
+		self._store(df2)
+		print (str(len(df2)) + " new datapoints preprocessed")
+		return df2
+
+	def get_dataset(self):
+		"""This function returns the full preprocessed dataset (all the chunks appended so far)
+
+		Returns
+		-------
+		df2 : Pandas Data Frame
+			the preprocessed dataset (see preprocessing)
+
+		"""
+		if (len(self.chunks)==0):
+			return pd.DataFrame()
+		if (len(self.chunks)>1):
+			self.chunks = [pd.concat(self.chunks, ignore_index=True)]
+		return self.chunks[0]
+
+	def _store(self,df2):
+		"""This function saves a preprocessed chunk and the last datapoint of each of its sessions and trackers"""
+		self.chunks.append(df2)
+		last_rows = df2.groupby(['session','tracker'], sort=False, observed=True).tail(1)
+		for i in range(len(last_rows)):
+			row = last_rows.iloc[[i]]
+			self.last_samples[(row['session'].iat[0], row['tracker'].iat[0])] = row
+
+	def _previous_timestamps(self,df):
+		"""This function returns, for each row of df, the timestamp of the last preprocessed datapoint 
+		of its session and tracker (NaT if there is not any)"""
+		previous = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+		for key, rows in df.groupby(['session','tracker'], sort=False, observed=True).indices.items():
+			if key in self.last_samples:
+				previous.iloc[rows] = self.last_samples[key]['timestamp'].iat[0]
+		return previous
+
+def aggregate_samples(df,settings=None):
+	"""This function aggregates all the datapoints of each tracker that fall in the same time bucket
+	into a single datapoint. This enables the use of high frequency positioning data (e.g. 10-20 Hz)
+	without thinning it by hand. The timestamp of each bucket is the beginning of the bucket. 
+
+	This function reads the following parameters from the settings:
+	sampling_frequency
+	aggregation
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		A Localization DataFrame whith at least the following columns: 
+			timestamp (datetime as "%Y-%m-%d_%H:%M:%S")
+			session (identifier)
+			tracker (identifier)
+			x and y (coordinates)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df : Pandas Data Frame
+		a Data Frame with one row per session, tracker and time bucket. x and y are aggregated
+		using the 'mean', 'median' or the 'last' value in the bucket. Other columns keep the last value. 
+
+	"""
+	settings = _settings.get_settings(settings)
+	sampling_frequency = settings.sampling_frequency
+	aggregation = settings.aggregation
+
+	keys = ['session','tracker','timestamp']
+	df = df.assign(timestamp=df['timestamp'].dt.floor(sampling_frequency))
+
+	functions = {}
+	for column in df.columns:
+		if column in ('x','y'):
+			functions[column] = aggregation
+		elif column not in keys:
+			functions[column] = 'last'
+	df = df.groupby(keys, sort=False, observed=True).agg(functions).reset_index()[list(df.columns)]
+	return df
+
+def sampling_and_interpolating(df,_fill_NaN_Values,settings=None):
 	"""This function does the following:
 	1) SAMPLING: It normalises the sampling frequency of the positioning data to 1Hz (
-	exactly one datapoint per second per tracker)
+	exactly one datapoint per second per tracker) or to the sampling frequency set in the configuration file
 	2) INTERPOLATION: It interpolates missing values for each tracker to have exactly 60 
 	data points per second. 
 
+	This function reads the following parameters from the settings:
+	sampling_frequency
+
+	Datapoints that are not aligned with the sampling frequency are not used. Use aggregate_samples
+	first if the positioning data has a higher frequency.
+
 	Parameters
 	----------
 	df : Pandas Data Frame
@@ -116,65 +384,52 @@ def sampling_and_interpolating(df,_fill_NaN_Values):
 	_Fill_NaN_Values: int
 		If Fill NaN Values= 1 the rows that will be added as a result of interpolating x and y data
 		will be filled with data from previous rows. In doubt, set it to 1
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
 	df2 : Pandas Data Frame
 		a downsampled Pandas dataset. If other columns are present the new rows created as a result 
 		of the interpolation copy the same values as the previous row. 
-		A new Interpolated column is added to indicate with 1 if a row was inserted; 
-		and 0 if the row was in the original dataset.)
+		A new Interpolated column is added to indicate with True if a row was inserted; 
+		and False if the row was in the original dataset.)
 
 	"""
 	Fill_NaN_Values=_fill_NaN_Values
+	sampling_frequency = _settings.get_settings(settings).sampling_frequency
+	keys = ['session','tracker']
+
+	## Create a time range with 1 data point per second (sampling frequency) for each session and tracker, from the first to the last timestamp
+	bounds = df.groupby(keys, sort=True, observed=True)['timestamp'].agg(['first','last']).reset_index()
+	steps = ((bounds['last'] - bounds['first']) // sampling_frequency).fillna(-1).astype(np.int64).values
+	steps = np.maximum(steps + 1, 0)
+	offsets = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+	df_time = pd.DataFrame({
+		'session': np.repeat(bounds['session'].values, steps),
+		'tracker': np.repeat(bounds['tracker'].values, steps),
+		'timestamp': np.repeat(bounds['first'].values, steps) + (offsets * sampling_frequency.value).astype('timedelta64[ns]')
+	})
+
+	## MERGE classroom dataframe to the new time range (all sessions and trackers at once)
+	df2 = pd.merge(df_time, df, on=['session','tracker','timestamp'], how='left', indicator=True)
+	# Add a signal that indicates if each row was contained in the original dataset (False) or whether it is interpolated to fill gaps (True)
+	interpolated = (df2['_merge'] == 'left_only').values
+	df2 = df2[list(df.columns)]
+
+	## FILL MISSING VALUES - interpolate values 
+	# fill x and y using linear interpolation within each session and tracker
+	df2[['x', 'y']] = df2.groupby(keys, sort=False, observed=True)[['x', 'y']].transform(
+		lambda values: values.interpolate(method='linear', axis=0).ffill().bfill())
 
-	#output data frame
-	df2 = pd.DataFrame()
-	# Add a signal to the input dataset that indicates if each row was contained in the original dataset (0) or whether t is interpolated to fill gaps (1)
-	df['interpolated'] = '0'
-
-	# get unique 'tracker' valuea for the loop
-	list_tracker = df.tracker.unique()
-	# get unique 'session' value for the loop
-	list_session = df.session.unique()
-
-	session_tracker=df.groupby(['session','tracker']).size().reset_index().rename(columns={0:'count'})
-
-	for index, row_pair in session_tracker.iterrows():
-			#GET sub dataframe for a particular tracker
-			session_df = df[(df['tracker'] == row_pair['tracker']) & (df['session'] == row_pair['session'])]
-			
-			## Create new dataframe with 60 data points per second for each session using start and end time from classroom dataset
-			# get first value in timestamp 
-			first = session_df['timestamp'].iloc[0]
-			# last value
-			last = session_df['timestamp'].iloc[-1]
-			# create time range for new dataframe 
-			df_time = pd.date_range(start = first, end = last, freq='S') 
-			
-			## MERGE classroom dataframe to new dataframe with 60 data points 
-			session_df = session_df.set_index('timestamp') # need to index timestamp 
-			merge = pd.merge(df_time.to_frame(), session_df, left_index = True, right_on = 'timestamp', how ='left')#.fillna(method='ffill')
-					
-				
-			## FILL MISSING VALUES - interpolate values 
-			# forward-fill (using existing values to fill)
-			m = merge.copy()
-			
-			# fill x and y using linear interpolation
-			m[['x', 'y']] = m[['x', 'y']].interpolate(method='linear', axis=0).ffill().bfill()
-			
-			# SAVE
-			df2 = df2.append(m)
-			df2.reset_index(drop=True, inplace=True)
-
-	#Flag added rows as a result of interpolation        
-	df2['interpolated'] = df2['interpolated'].fillna('1')
 	#copy NaN values from previous rows 
-	df2.fillna(method='ffill', inplace=True)
+	other_columns = [column for column in df2.columns if column not in keys]
+	df2[other_columns] = df2.groupby(keys, sort=False, observed=True)[other_columns].ffill()
+	#Flag added rows as a result of interpolation        
+	df2['interpolated'] = interpolated
 	return df2
 
-def add_rotation(df):
+def add_rotation(df,settings=None):
 	"""This function adds a new column 'rotation' in degrees from pitch,roll or yaw in radians 
 
 	Parameters
@@ -190,7 +445,8 @@ def add_rotation(df):
 		'yaw', 'roll' or 'pitch'
 	_north : float
 		the rotation in radians facing north (UPPER direction in the floor plan)
-			
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -199,8 +455,9 @@ def add_rotation(df):
 
 	"""
 
-	target_column= config.get('parameters','target_column')
-	north= float(config.get('parameters','north'))
+	settings = _settings.get_settings(settings)
+	target_column= settings.target_column
+	north= settings.north
 
 	df['rotation'] = calculate_rotation(df[target_column],north)
 	return df
@@ -248,16 +505,41 @@ def add_phases(df,dfPhases,_include_all_data):
 		the same Data Frame with the new column "phase" added
 
 	"""
-	phases = []
-	#add Phase number to each data point
-	for index, row_pair in df.iterrows():
-		res=dfPhases.loc[(row_pair['session'] == dfPhases['session']) & (row_pair['timestamp'] >= dfPhases['start']) & (row_pair['timestamp'] <= dfPhases['end']) & (dfPhases['phase']!=0)]
-
-		if (len(res)>0):
-			phases.append(res['phase'].values[0])
-
-		else: 
-			phases.append(-100)
+	#phases of each session in the order of the file (phase 0 is ignored). A datapoint that belongs to several 
+	#phases (overlapping or nested phases, or the boundary between two consecutive phases) is assigned to the 
+	#first of them in the file
+	phases_by_session = {}
+	valid_phases = dfPhases.loc[dfPhases['phase'] != 0]
+	for session, session_phases in valid_phases.groupby('session', sort=False):
+		starts = session_phases['start'].values
+		ends = session_phases['end'].values
+		by_start = np.argsort(starts, kind='mergesort')
+		disjoint = bool(np.all(starts[by_start][1:] > ends[by_start][:-1]))
+		phases_by_session[session] = (starts, ends, session_phases['phase'].values, disjoint)
+
+	#Datapoints out of any phase get the value -100
+	phases = np.full(len(df), -100, dtype=np.int64)
+	timestamps = df['timestamp'].values
+	for session, rows in df.groupby('session', sort=False).indices.items():
+		if session not in phases_by_session:
+			continue
+		starts, ends, numbers, disjoint = phases_by_session[session]
+		times = timestamps[rows]
+		if disjoint:
+			#interval join: for each datapoint find the first phase that ends at or after its timestamp 
+			#and keep it if the phase started before the timestamp
+			by_end = np.argsort(ends, kind='mergesort')
+			candidate = np.searchsorted(ends[by_end], times, side='left')
+			found = candidate < len(ends)
+			candidate[~found] = 0
+			candidate = by_end[candidate]
+			found &= starts[candidate] <= times
+			phases[rows[found]] = numbers[candidate[found]]
+		else:
+			#the phases overlap: every phase is compared with all the datapoints, from the last phase of the 
+			#file to the first one, so the first phase of the file that contains a datapoint is kept
+			for start, end, number in zip(starts[::-1], ends[::-1], numbers[::-1]):
+				phases[rows[(start <= times) & (times <= end)]] = number
 
 	#add new Phase column to Data Frame
 	df['phase'] = phases 
@@ -267,7 +549,7 @@ def add_phases(df,dfPhases,_include_all_data):
 	return df
 
 
-def add_quantiles(df,dfPhases):
+def add_quantiles(df,dfPhases,settings=None):
 	"""This function adds a new column 'quantile' to the main dataset. The function equally splits EACH phase
 	in X parts of equal duration. X = NumberOfQuantiles. Each data point is marked with the number of the part 
 	from 1 to X. 
@@ -284,9 +566,12 @@ def add_quantiles(df,dfPhases):
 			end  : datetime
 			comment : string (optional, not used by this script)
 		Phases have to be numbered starting from 1. Phase 0 will be ignored.
+		This Data Frame is not modified.
 	_numberOfQuantiles	: int
 		Number of parts in which the data within each phase will be divided based on their timestamps. 
 		4 for quantiles but it can be another number
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
@@ -295,24 +580,22 @@ def add_quantiles(df,dfPhases):
 
 	"""
 	
-	_numberOfQuantiles = float(config.get('parameters','numberOfQuantiles'))
-	#CALCULATE QUANTILE DURATION
-	dfPhases['quantile_duration']= ((dfPhases['end'] - dfPhases['start']) /np.timedelta64(1,'s') )/ _numberOfQuantiles
-	
+	_numberOfQuantiles = _settings.get_settings(settings).numberOfQuantiles
+
+	#JOIN THE START AND END OF THE PHASE OF EACH DATAPOINT (the first row is used if a phase is repeated)
+	phase_bounds = dfPhases[['session','phase','start','end']].drop_duplicates(subset=['session','phase'])
+	bounds = df[['session','phase']].merge(phase_bounds, on=['session','phase'], how='left')
+	in_phase = bounds['start'].notna().values
+
+	#CALCULATE QUANTILES: elapsed time since the start of the phase divided by the duration of a quantile
+	#(duration of the phase / _numberOfQuantiles) using integer nanoseconds
+	start = bounds['start'].values.astype('datetime64[ns]').astype(np.int64)
+	end = bounds['end'].values.astype('datetime64[ns]').astype(np.int64)
+	timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+	elapsed = np.where(in_phase, timestamps - start, 0)
+	phase_duration = np.where(in_phase, np.maximum(end - start, 1), 1)
+	quantiles = np.minimum(elapsed * _numberOfQuantiles // phase_duration + 1, _numberOfQuantiles)
 
 	#ADD Quantile INFORMATION TO COLUMN
-	quantiles = []
-	for index, row_pair in df.iterrows():
-		res=dfPhases.loc[(row_pair['session'] == dfPhases['session']) & (row_pair['phase'] == dfPhases['phase'])]
-		if (len(res)>0):
-			q= math.floor( (((row_pair['timestamp'] - res['start']) /np.timedelta64(1,'s')) / res['quantile_duration'])+1)
-			if (q>_numberOfQuantiles):
-				q=_numberOfQuantiles
-		else:
-			q=-100
-		quantiles.append(q) 
-		
-	df['quantile'] = quantiles   
+	df['quantile'] = np.where(in_phase, quantiles, -100)
 	return df
-
-
@@ -0,0 +1,175 @@
+"""Scripts to generate metrics related to the distance between moving trackers
+
+This script allows the user to
+i) calculate the distance between every pair of trackers of a session at each time of the preprocessed
+	dataset (e.g. every second), and
+ii) summarise it per phase as the time each pair of trackers was close to each other (co-presence) and
+	their mean distance
+
+The positions of all the trackers of a session are aligned in an array of (time x tracker x 2) coordinates,
+and the distances of all the pairs (i < j) are calculated with array operations, a slice of time at a time.
+
+This script requires that `pandas` be installed within the Python
+environment you are running this script in.
+
+This file can also be imported as a module and contains the following functions:
+    * calculate_proximity_by_pair (main function) - co-presence time and mean distance of each pair of trackers
+		by session and phase
+	* calculate_proximity_by_tracker - the same metrics of each tracker with all the other trackers (used by
+		_metricsMain.get_metrics)
+	* align_positions (auxiliar) - this function aligns the positions of the trackers of a session in a
+		(time x tracker x 2) array
+"""
+import numpy as np
+import pandas as pd
+import _settings
+
+#Maximum number of distances calculated at once (time steps x pairs of trackers)
+CHUNK_SIZE = 1 << 22
+#Phase of the trackers at the times they have no datapoint
+MISSING_PHASE = -1
+
+def calculate_proximity_by_pair(df_preprocessed,settings=None):
+	"""This function calculates, for each pair of trackers of each session and phase, the time they were closer
+		than the parameter "proximity_distance" (co-presence) and their mean distance. Only the times when both
+		trackers have a position and are in the same phase are considered.
+
+	This function reads the following parameters from the settings:
+	proximity_distance
+	sampling_frequency
+
+	Parameters
+	----------
+	df_preprocessed : Pandas Data Frame
+		the preprocessed dataset (see _preprocessing.preprocessing) with at least the following columns:
+			timestamp (datetime as "%Y-%m-%d_%H:%M:%S")
+			session (identifier)
+			tracker (identifier)
+			x and y (coordinates)
+			phase (int)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df_proximity : Pandas Data Frame
+		returns a data frame with one row per session, phase and pair of trackers with the following columns
+			session (identifier)
+			phase (int)
+			tracker_a, tracker_b (identifiers of the trackers of the pair)
+			samples (int) number of times both trackers have a position
+			copresence_time_sec (float) time the trackers were closer than proximity_distance in seconds
+			mean_distance (float) mean distance between the trackers in milimeters
+	"""
+	print ("Calculating proximity between trackers")
+	settings = _settings.get_settings(settings)
+	proximity_distance = settings.proximity_distance
+	seconds_per_sample = settings.sampling_frequency.total_seconds()
+
+	results = []
+	for session, df_session in df_preprocessed.groupby('session', sort=True, observed=True):
+		timestamps, trackers, positions, phases = align_positions(df_session)
+		n_trackers = len(trackers)
+		if n_trackers < 2:
+			continue
+		first, second = np.triu_indices(n_trackers, 1)
+
+		#a pair of trackers is in a phase when both trackers are in that phase
+		phase_values = np.unique(phases[phases != MISSING_PHASE])
+		samples = np.zeros((len(phase_values), len(first)))
+		close = np.zeros((len(phase_values), len(first)))
+		distances = np.zeros((len(phase_values), len(first)))
+
+		#distances of all the pairs of trackers in slices of time (to limit the memory)
+		chunk = max(1, CHUNK_SIZE // len(first))
+		for start in range(0, len(timestamps), chunk):
+			end = min(start + chunk, len(timestamps))
+			d = np.sqrt(((positions[start:end, first, :] - positions[start:end, second, :]) ** 2).sum(axis=2))
+			valid = ~np.isnan(d)
+			pair_phases = np.where(phases[start:end, first] == phases[start:end, second], phases[start:end, first], MISSING_PHASE)
+			for index, phase in enumerate(phase_values):
+				selected = valid & (pair_phases == phase)
+				samples[index] += selected.sum(axis=0)
+				close[index] += (selected & (d <= proximity_distance)).sum(axis=0)
+				distances[index] += np.where(selected, d, 0.0).sum(axis=0)
+
+		with np.errstate(invalid='ignore', divide='ignore'):
+			mean_distance = distances / samples
+		results.append(pd.DataFrame({
+			'session': session,
+			'phase': np.repeat(phase_values, len(first)),
+			'tracker_a': np.tile(trackers[first], len(phase_values)),
+			'tracker_b': np.tile(trackers[second], len(phase_values)),
+			'samples': samples.ravel().astype(np.int64),
+			'copresence_time_sec': close.ravel() * seconds_per_sample,
+			'mean_distance': mean_distance.ravel()
+		}))
+
+	columns = ['session', 'phase', 'tracker_a', 'tracker_b', 'samples', 'copresence_time_sec', 'mean_distance']
+	if not results:
+		return pd.DataFrame(columns=columns)
+	df_proximity = pd.concat(results, ignore_index=True)
+	#pairs of trackers that were never in the same phase at the same time are not included
+	df_proximity = df_proximity.loc[df_proximity['samples'] > 0].reset_index(drop=True)
+	print ("Proximity between trackers COMPLETED")
+	return (df_proximity[columns])
+
+def calculate_proximity_by_tracker(df_proximity):
+	"""This function summarises the output of calculate_proximity_by_pair for each tracker: the time it was close
+		to other trackers (the sum over the other trackers) and its mean distance to the other trackers.
+
+	Parameters
+	----------
+	df_proximity : Pandas Data Frame
+		the data frame returned by calculate_proximity_by_pair
+
+	Returns
+	-------
+	df_proximity_tracker : Pandas Data Frame
+		returns a data frame with the index session, tracker, phase and the following columns
+			Copresence_time_mins (float) time close to other trackers in minutes (sum over the other trackers)
+			Mean_distance_to_trackers_meter (float) mean distance to the other trackers in meters
+	"""
+	#each pair of trackers counts for both trackers
+	pairs = pd.concat([
+		df_proximity.rename(columns={'tracker_a': 'tracker', 'tracker_b': 'other'}),
+		df_proximity.rename(columns={'tracker_b': 'tracker', 'tracker_a': 'other'})
+	], ignore_index=True)
+	pairs['total_distance'] = pairs['mean_distance'] * pairs['samples']
+	df_proximity_tracker = pairs.groupby(['session','tracker','phase'], observed=True).agg(
+	  Copresence_time_mins=pd.NamedAgg(column='copresence_time_sec', aggfunc='sum'),
+	  total_distance=pd.NamedAgg(column='total_distance', aggfunc='sum'),
+	  samples=pd.NamedAgg(column='samples', aggfunc='sum')
+	)
+	df_proximity_tracker['Copresence_time_mins'] = df_proximity_tracker['Copresence_time_mins'] / 60
+	df_proximity_tracker['Mean_distance_to_trackers_meter'] = df_proximity_tracker['total_distance'] / df_proximity_tracker['samples'] / 1000
+	return df_proximity_tracker[['Copresence_time_mins', 'Mean_distance_to_trackers_meter']]
+
+def align_positions(df_session):
+	"""This function aligns the positions of all the trackers of a session on the timeline of the preprocessed
+		dataset (the timestamps of the session).
+
+	Parameters
+	----------
+	df_session : Pandas Data Frame
+		the preprocessed datapoints of one session (see calculate_proximity_by_pair)
+
+	Returns
+	-------
+	timestamps : numpy array
+		sorted timestamps of the session (T)
+	trackers : numpy array
+		trackers of the session (K)
+	positions : numpy array
+		(T x K x 2) array with the coordinates x and y of each tracker at each time (NaN if it has no position)
+	phases : numpy array
+		(T x K) array with the phase of each tracker at each time (MISSING_PHASE if it has no datapoint)
+	"""
+	timestamps, time_index = np.unique(df_session['timestamp'].values, return_inverse=True)
+	tracker_index, trackers = pd.factorize(np.asarray(df_session['tracker']), sort=True)
+	positions = np.full((len(timestamps), len(trackers), 2), np.nan)
+	positions[time_index, tracker_index, 0] = df_session['x'].values.astype(np.float64)
+	positions[time_index, tracker_index, 1] = df_session['y'].values.astype(np.float64)
+	phases = np.full((len(timestamps), len(trackers)), MISSING_PHASE, dtype=np.int64)
+	phases[time_index, tracker_index] = df_session['phase'].fillna(MISSING_PHASE).values.astype(np.int64)
+	return timestamps, np.asarray(trackers), positions, phases
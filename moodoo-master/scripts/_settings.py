@@ -0,0 +1,130 @@
+"""Parameters of the scripts
+
+This script provides an immutable object with all the parameters used by the scripts. By default,
+the parameters are read (once) from the configuration file info.ini. Several Settings objects can be
+used in the same process, for example, to run the same analysis with different parameters.
+
+	Example:
+		import _settings
+		settings = _settings.load()                          # parameters from ../info.ini
+		settings_2m = settings.replace(distance=2000.0)      # same parameters with a different "distance"
+		df = stopsAndTransitions.stops_transitions(df_preprocessed, settings=settings_2m)
+
+All the public functions of the other scripts accept an optional "settings" argument. If it is not provided
+(None), the parameters from ../info.ini are used.
+
+This file can also be imported as a module and contains the following:
+	* Settings - immutable (and hashable) object with the parameters. See info.ini for a description of each parameter
+	* load - reads a configuration file into a Settings object (each file is read only once)
+	* get_settings - returns the given Settings object or the default one from ../info.ini
+"""
+import configparser
+import dataclasses
+import functools
+import os
+import pandas as pd
+
+#Default configuration file (relative to the folder where the scripts are run)
+DEFAULT_FILE = '../info.ini'
+
+@dataclasses.dataclass(frozen=True)
+class Settings:
+	"""Immutable object with the parameters of the scripts. The names of the attributes are the
+	names of the parameters in the configuration file (section [parameters]).
+	"""
+	#DIMENSIONS OF THE ROOM
+	room_x: float = 16810.0
+	room_y: float = 9860.0
+	HorizonalZero: str = 'right'
+	VerticalZero: str = 'down'
+	#SAMPLING
+	sampling_frequency: pd.Timedelta = pd.Timedelta('1s')
+	aggregation: str = 'mean'
+	#STOPS AND TRANSITIONS
+	distance: float = 1000.0
+	duration: pd.Timedelta = pd.Timedelta('00:00:10')
+	distance_tracker_fixed_point: float = 2000.0
+	stop_detection: str = 'base_point'
+	st_dbscan_time_window: pd.Timedelta = pd.Timedelta('00:00:10')
+	st_dbscan_min_points: int = 5
+	simplification_tolerance: float = 0.0
+	#ROTATION
+	target_column: str = 'yaw'
+	north: float = 3.21
+	#PROXIMITY BETWEEN TRACKERS
+	proximity_distance: float = 1500.0
+	#ENTROPY
+	size_of_grid_cells: float = 1000.0
+	#OUTPUT
+	numberOfQuantiles: int = 3
+	weighted: int = 1
+	#MEMORY
+	compact_dtypes: int = 0
+	memory_report: int = 0
+
+	def __post_init__(self):
+		#Convert the values to the type of each attribute (e.g. when they are read from a file as strings)
+		for field in dataclasses.fields(self):
+			value = getattr(self, field.name)
+			if field.type is pd.Timedelta:
+				value = pd.Timedelta(value)
+			elif field.type is int:
+				value = int(float(value))
+			else:
+				value = field.type(value)
+			object.__setattr__(self, field.name, value)
+		if self.aggregation not in ('mean', 'median', 'last'):
+			raise ValueError("aggregation can ONLY take the values: 'mean', 'median' or 'last'")
+		if self.stop_detection not in ('base_point', 'st_dbscan'):
+			raise ValueError("stop_detection can ONLY take the values: 'base_point' or 'st_dbscan'")
+
+	def replace(self, **changes):
+		"""Returns a new Settings object with some of the parameters changed"""
+		return dataclasses.replace(self, **changes)
+
+	@classmethod
+	def from_ini(cls, source_file=DEFAULT_FILE):
+		"""Reads the section [parameters] of a configuration file. Parameters that are not in the file
+		take the default values of this class.
+
+		Parameters
+		----------
+		source_file : string
+			full filename of the configuration file (optional, ../info.ini by default)
+
+		Returns
+		-------
+		settings : Settings
+		"""
+		config = configparser.ConfigParser()
+		if not config.read(source_file):
+			raise FileNotFoundError("Configuration file not found: " + os.path.abspath(source_file))
+		values = {}
+		for field in dataclasses.fields(cls):
+			if config.has_option('parameters', field.name):
+				values[field.name] = config.get('parameters', field.name)
+		return cls(**values)
+
+@functools.lru_cache(maxsize=None)
+def _load(source_file):
+	return Settings.from_ini(source_file)
+
+def load(source_file=DEFAULT_FILE):
+	"""Returns the Settings of a configuration file. Each file is read only once.
+
+	Parameters
+	----------
+	source_file : string
+		full filename of the configuration file (optional, ../info.ini by default)
+
+	Returns
+	-------
+	settings : Settings
+	"""
+	return _load(os.path.abspath(source_file))
+
+def get_settings(settings=None):
+	"""Returns the given Settings or, if None, the Settings of the default configuration file (../info.ini)"""
+	if settings is None:
+		return load()
+	return settings
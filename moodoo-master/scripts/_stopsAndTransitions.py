@@ -12,27 +12,35 @@ environment you are running this script in.
 
 This file can also be imported as a module and contains the following functions:
     * stops_transitions (main) - this function calls the three functions below to get a new data frame of stops and transitions  
+	* stops_transitions_parallel - this function generates the same data frame as stops_transitions, clustering the 
+		datapoints of each tracker and session in a pool of processes
+	* stops_transitions_sweep - this function generates stops and transitions for several values of the parameters distance 
+		and duration (e.g. to check how sensitive the results are to these parameters)
 	* generate_positioning_clusters - This function generates a data frame that clusters data points 
 		according to their distance.
 	* tag_clusters - This function generates a data frame that identifies clusters 
 		(the output from function generate_positioning_clusters) as stops or transitions.
+	* simplify_transitions - This function removes datapoints of the transitions that are not needed to keep 
+		their shape (Ramer-Douglas-Peucker), keeping the length of the original path.
 	* get_stops_and_transitions - This function generates a data frame that contains meta data about stops  (one per line) and transitions (all the lines 
 		to enable further modelling of the trajectory itself)
+	* Segments - compact output with one row per stop and transition (the datapoints of the transitions are created when needed)
+	* StopDetector - class that detects stops and transitions while the positioning data arrives (e.g. for a live dashboard)
  
 """
-import configparser
 import numpy as np 
 import pandas as pd 
 import math
 import datetime
 from dateutil import parser
 import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
 import _util as util
-#load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+import _settings
 
-def stops_transitions(df_preprocessed):
+def stops_transitions(df_preprocessed,settings=None,segments=False):
 	"""This functions calls the following functions to model the preprocessed dataset as stops and transitions: 
 	1) add_phases
 	2) add_quantiles
@@ -51,7 +59,10 @@ def stops_transitions(df_preprocessed):
 			x and y (coordinates)
 			phase (int)
 			quantile (int) Set to 1 if not interested in using this column
-
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+	segments : boolean
+		if True, a compact Segments object is returned instead of a data frame (see get_stops_and_transitions)
 
 	Returns
 	-------
@@ -65,28 +76,159 @@ def stops_transitions(df_preprocessed):
 			type - (string) indicating if the data point belongs to a "stop" or a "transition"
 			x, y - point at the centroids of the stops 
 			x_stdev, y_stdev - standard deviation of the points within a stop. (for transitions the value is zero)
+		If the parameter simplification_tolerance is larger than zero, the transitions are simplified 
+		(see simplify_transitions) and the data frame has the columns path_dist and path_points.
+		If the parameter compact_dtypes is 1, the columns are converted with _util.compact_dtypes(). 
+		If the parameter memory_report is 1, the memory footprint of each step is printed and saved in 
+		df.attrs['memory_report'] as a tuple of (stage, rows, columns, memory_MB) rows.
+
+	"""
+	settings = _settings.get_settings(settings)
+	return _stops_transitions(df_preprocessed,generate_positioning_clusters,settings,segments)
+
+def stops_transitions_parallel(df_preprocessed,_workers,settings=None,segments=False):
+	"""This function runs the same steps as the function stops_transitions, but the datapoints of each 
+	tracker and session are clustered (see generate_positioning_clusters) in a pool of processes. 
+	The sorted coordinates are shared with the processes in shared memory buffers (instead of sending parts of 
+	the data frame) and each process saves its clusters in other shared buffers. The clusters are numbered 
+	afterwards for all the trackers and sessions, so the result is the same as the one of stops_transitions.
+
+	NOTE: on systems that start processes with "spawn" (Windows and macOS), the script that calls this 
+	function has to be protected with: if __name__ == '__main__':
+
+	Parameters
+	----------
+	df_preprocessed : Pandas Data Frame
+		the preprocessed dataset (see stops_transitions)
+	_workers: int
+		Number of processes
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+	segments : boolean
+		if True, a compact Segments object is returned instead of a data frame (see get_stops_and_transitions)
+
+	Returns
+	-------
+	df : Pandas Data Frame
+		the output of stops_transitions
 
 	"""
+	settings = _settings.get_settings(settings)
+	clustering = lambda df, settings: _cluster_parallel(_sort_positions(df), settings.distance, settings, _workers)
+	return _stops_transitions(df_preprocessed,clustering,settings,segments)
+
+def _stops_transitions(df_preprocessed,clustering,settings,segments):
+	"""This function runs all the steps of stops_transitions with a clustering function (see 
+	generate_positioning_clusters)"""
+	#memory footprint of each step (only if the parameter memory_report is 1)
+	memory_report = [] if settings.memory_report==1 else None
+	util.add_memory_footprint(memory_report, 'input', df_preprocessed)
 	#Cluster datapoints as stops and transitions
-	df=generate_positioning_clusters(df_preprocessed)
+	df=clustering(df_preprocessed,settings)
+	util.add_memory_footprint(memory_report, 'generate_positioning_clusters', df)
 	print ("Generating clusters completed")
 	
 	#Tag clusters as stops or transition
-	df=tag_clusters(df)
+	df=tag_clusters(df,settings)
+	util.add_memory_footprint(memory_report, 'tag_clusters', df)
 	print ("Clusters tagged")
+
+	#Simplify the transitions
+	if (settings.simplification_tolerance>0):
+		df=simplify_transitions(df,settings)
+		util.add_memory_footprint(memory_report, 'simplify_transitions', df)
 	
 	#Generate data frame with information about stops and transitions to be further processed to generate metrics
-	df=get_stops_and_transitions(df)
+	df=get_stops_and_transitions(df,segments)
+	if segments:
+		util.add_memory_footprint(memory_report, 'get_stops_and_transitions (segments)', df.segments)
+		util.add_memory_footprint(memory_report, 'get_stops_and_transitions (positions)', df.positions)
+	else:
+		util.add_memory_footprint(memory_report, 'get_stops_and_transitions', df)
 	print ("Data frame of stops and transitions generated")
-	
+
+	#Convert to compact data types
+	if (settings.compact_dtypes==1 and segments):
+		df=Segments(util.compact_dtypes(df.segments), util.compact_dtypes(df.positions))
+		util.add_memory_footprint(memory_report, 'compact_dtypes (segments)', df.segments)
+		util.add_memory_footprint(memory_report, 'compact_dtypes (positions)', df.positions)
+	elif (settings.compact_dtypes==1):
+		df=util.compact_dtypes(df)
+		util.add_memory_footprint(memory_report, 'compact_dtypes', df)
+
+	if memory_report is not None:
+		#the report is saved as a tuple of rows (pandas copies the attrs on every operation on the Data Frame)
+		(df.segments if segments else df).attrs['memory_report'] = tuple(tuple(step.values()) for step in memory_report)
+		print ("Memory footprint of each step:")
+		print (pd.DataFrame(memory_report).to_string(index=False))
 	print ("Processing stops and transitions COMPLETED")
 	return (df)
 
 
-def generate_positioning_clusters(df):
+def stops_transitions_sweep(df_preprocessed,distances=None,durations=None,settings=None):
+	"""This function generates the stops and transitions (see stops_transitions) for every combination of 
+	the given values of the parameters distance and duration. The datapoints are sorted once for all the 
+	combinations and clustered once per distance value; the stops of every duration are tagged from the same 
+	clusters. The result for each combination is the same as running stops_transitions with those parameters.
+
+	Parameters
+	----------
+	df_preprocessed : Pandas Data Frame
+		the preprocessed dataset (see stops_transitions)
+	distances : list of float
+		values of the parameter distance in mm (optional, the value in the settings by default)
+	durations : list of Timedelta, string or float
+		values of the parameter duration. Numbers are seconds (optional, the value in the settings by default)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df : Pandas Data Frame
+		the outputs of stops_transitions for all the combinations, one after the other, with two new 
+		columns at the beginning: distance (float) and duration (Timedelta)
+
+	"""
+	settings = _settings.get_settings(settings)
+	if distances is None:
+		distances = [settings.distance]
+	if durations is None:
+		durations = [settings.duration]
+	durations = [pd.Timedelta(seconds=duration) if isinstance(duration, (int, float)) else pd.Timedelta(duration) for duration in durations]
+
+	#Sort the datapoints and calculate the distance between consecutive datapoints once
+	positions = _sort_positions(df_preprocessed)
+
+	results = []
+	for distance in distances:
+		#Cluster datapoints once per distance and tag the stops of every duration
+		df_durations = _cluster_durations(_cluster(positions, float(distance), settings))
+		for duration in durations:
+			df = _tag_stops(df_durations.copy(deep=False), duration)
+			if (settings.simplification_tolerance>0):
+				df = simplify_transitions(df, settings)
+			df = get_stops_and_transitions(df)
+			df.insert(0, 'duration', duration)
+			df.insert(0, 'distance', float(distance))
+			results.append(df)
+		print ("Stops and transitions generated for distance " + str(distance))
+
+	df = pd.concat(results, ignore_index=True)
+	if (settings.compact_dtypes==1):
+		df=util.compact_dtypes(df)
+	return (df)
+
+def generate_positioning_clusters(df,settings=None):
 	"""This function generates a data frame that clusters data points according to their distance.  
-		The parameter "distance" is read from the config file and it is used to create a new cluster 
+		The parameter "distance" is read from the settings and it is used to create a new cluster 
 		if the distance between two consecutive datapoints is higher than the parameter 'distance'
+
+	If the parameter "stop_detection" is 'st_dbscan', the datapoints are clustered by density (ST-DBSCAN) instead: 
+		two datapoints of the same tracker and session are neighbours if they are closer than "distance" and 
+		"st_dbscan_time_window" apart, and a cluster is made of the datapoints with at least "st_dbscan_min_points" 
+		neighbours (core points, including themselves), their neighbours and the neighbours of their neighbours that 
+		are core points. Each sequence of consecutive datapoints of the same cluster is a group (datapoints that do 
+		not belong to any cluster are a group each). This does not depend on the order of the datapoints.
 	
 	Parameters
 	----------
@@ -98,147 +240,336 @@ def generate_positioning_clusters(df):
 			x and y (coordinates)
 			phase (int)
 			quantile (int) Set to 1 if not interested in using this column
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
-	data1
+	df2
 		returns a data frame with the following additional columns
 			group - the cluster id (a self incremental intiger that starts from 1)
 			base_dist - distance from a datapoint to the first datapoint in the cluster
 			intra_dist - distance to the previous data point
-			time_diff - time difference from the previous data point
+			time_diff - time difference from the first datapoint in the cluster (NaT for the first one)
 
 	"""
-	#CALCULATE DISTANCE BETWEEN TWO SUBSEQUENCED DATA POINTS
-	df_dist = pd.DataFrame()
-		  
-	list_tracker = df.tracker.unique()
-	list_session = df.session.unique()
-
-	for x,i in enumerate(list_tracker):
-			
-		## Loop through unique tracker and session       
-		#df = df.copy()
-		tracker2 = i
-		tracker_df = df[df['tracker'] == tracker2]
-			
-		for y,j in enumerate(list_session):
-			
-			session2 = j
-			session_df = tracker_df[tracker_df['session'] == session2]
-
-			# Shift x and y to get the coordinates of the previous positioning datapoint
-			session_df['x_shifted'] = session_df.groupby(['session'])['x'].shift(1)
-			session_df['y_shifted'] = session_df.groupby(['session'])['y'].shift(1)
-			
-			# Remove first row of every session (shifted = nan)
-			session_df = session_df.dropna()
-			
-			# Calculate distance between two points
-			session_df['dist'] = np.sqrt((session_df['x_shifted'] - session_df['x']) ** 2 + (session_df['y_shifted'] - session_df['y']) ** 2)
-			
-			# Append Distance column
-			df_dist = df_dist.append(session_df) 
-
-
-	#CREATE CLUSTERS OF DATA POINTS (STOPS) according to Distance and Duration parameters
-
-
-	#Load parameter that is used to create a new cluster if the distance between two consecutive datapoints is
-	#higher than the parameter 'distance'
-	distance= float(config.get('parameters','distance'))
-
-	#sequential numbering of clusters of positioning datapoints (called in this code "group or grouping")
-	fix_seq = 1      #fixation sequence, starts at 1 (then adds +1) --> to create group numbering
-
-	data1 = [] #this will be used to save clusters 
-
-
-	## Loop through unique tracker and session
-	
-	previous_row = None
-	for x,i in enumerate(list_tracker):
-
-		tracker = i
-		tracker_df = df[df['tracker'] == tracker]
-		
-		for y,j in enumerate(list_session):
-			count=0
-			session = j
-			session_df = tracker_df[tracker_df['session'] == session]
-			
-			# print details of each tracker and seesion while code is running (useful in identifying if code breaks) 
-			#print(tracker, session, len(session_df))
-			
-			# Convert dataframe to list 
-			#data = session_df.values.tolist()
-			data = session_df
-			
-			## Loop through each row
-			# if row (k) > 0; if <= t_hold then calculate distance to base point, and add to time 
-			#                if > t_hold - then redefine base point and start calculating distance to base point and add time
-			# if row (k) = 0; then use the values as is (see elif k == 0)
-			
-			for k, row_pair in data.iterrows():
-				count=count+1
-			#for k, i in enumerate(data[0:]):
-				if count > 1: 
-					p_time = row_pair["timestamp"]
-			
-					# x = column [5]; y = column [6]
-					x2 = float(row_pair["x"]) # current row value 
-					x1 = float(previous_row["x"]) # previous row value 
-					y2 = float(row_pair["y"])
-					y1 = float(previous_row["y"]) 
-					phase = int(row_pair["phase"])
-					quantile = int(row_pair["quantile"])
-			
-					# calculate the distance from previous point
-					dist_p = math.sqrt((x2-x1)**2+(y2-y1)**2) 
-					# calculate the distance from base point (the first point in the group/cluster)
-					dist_b = math.sqrt((x2-b_x1)**2+(y2-b_y1)**2) 
-					#caluclate the time delta from base point
-					t_diff = p_time - b_time 
-
-					if dist_b <= distance:  
-						# if distance from current point to centroid is lower than threshold (distance = 1000mm - 1m), 
-						# it means that the person/object is covering a short distance - the point is inside the cluster
-						# add to list with current cluster/group number
-						data1.append([fix_seq, tracker, session, phase, quantile, str(p_time), x2, y2, dist_b, dist_p, t_diff])
-						
-					elif dist_b > distance:
-						# if distance from current point to centroid is higher than threshold (distance = 1000mm - 1m), 
-						# it means that the person/object is in another cluster - then change centroid info
-						#Create new cluster or grouping
-						b_time = row_pair["timestamp"]
-						b_x1 = float(row_pair["x"])
-						b_y1 = float(row_pair["y"])                    
-						phase = int(row_pair["phase"])
-						quantile = int(row_pair["quantile"])
-				
-						fix_seq = fix_seq + 1 # coordinate grouping according to distance threshold 
-						data1.append([fix_seq, tracker, session, phase, quantile, b_time, b_x1, b_y1, dist_b, dist_p])
-						# don't add t_diff as 0; leaving blank will introduce NaT (which will identify the column as timedate type) 
-
-					t_diff = p_time - b_time
-					previous_row=row_pair
-
-				elif count == 1:
-					previous_row=row_pair
-					b_time = row_pair["timestamp"]
-					b_x1 = float(row_pair["x"])
-					b_y1 = float(row_pair["y"])
-					phase = int(row_pair["phase"])
-					quantile = int(row_pair["quantile"])
-					data1.append([fix_seq, tracker, session, phase, quantile, b_time, b_x1, b_y1, 0, 0])
-					# don't add t_diff as 0; leaving it blank will introduce NaT (which will identify the column as timedate type) 
-
-	df2 = pd.DataFrame (data1,columns=['group','tracker','session','phase','quantile','timestamp','x','y','base_dist','intra_dist','time_diff'])
+	#Load parameter that is used to create a new cluster if the distance between a datapoint and the first datapoint
+	#of the current cluster (base point) is higher than the parameter 'distance'
+	settings = _settings.get_settings(settings)
+
+	return _cluster(_sort_positions(df), settings.distance, settings)
+
+def _cluster(positions, distance, settings):
+	"""This function clusters the datapoints sorted by _sort_positions with the algorithm in the parameter 
+	stop_detection (see generate_positioning_clusters)"""
+	if (settings.stop_detection=='st_dbscan'):
+		return _cluster_positions_st_dbscan(positions, distance, settings.st_dbscan_time_window, settings.st_dbscan_min_points)
+	return _cluster_positions(positions, distance)
+
+def _sort_positions(df):
+	"""This function sorts the datapoints once, so that the datapoints of each tracker and session are contiguous
+	(trackers and sessions in order of appearance, datapoints of each tracker and session in their original order),
+	and returns the arrays used to cluster them (with any distance) as a dictionary"""
+	#Datapoints without coordinates cannot be clustered
+	df = df[df['x'].notna() & df['y'].notna()]
+
+	tracker_codes = pd.factorize(np.asarray(df['tracker']))[0]
+	session_codes = pd.factorize(np.asarray(df['session']))[0]
+	order = np.lexsort((session_codes, tracker_codes))
+	tracker_codes = tracker_codes[order]
+	session_codes = session_codes[order]
+	x = df['x'].values[order].astype(np.float64)
+	y = df['y'].values[order].astype(np.float64)
+
+	#first datapoint of each tracker and session
+	n = len(order)
+	first = np.ones(n, dtype=bool)
+	first[1:] = (tracker_codes[1:] != tracker_codes[:-1]) | (session_codes[1:] != session_codes[:-1])
+	group_starts = np.flatnonzero(first)
+
+	# calculate the distance from previous point
+	intra_dist = np.zeros(n)
+	intra_dist[1:] = np.sqrt((x[1:] - x[:-1]) ** 2 + (y[1:] - y[:-1]) ** 2)
+	intra_dist[first] = 0
+
+	return {
+		'tracker': df['tracker'].values[order],
+		'session': df['session'].values[order],
+		'phase': df['phase'].values[order].astype(np.int64),
+		'quantile': df['quantile'].values[order].astype(np.int64),
+		'timestamp': df['timestamp'].values[order].astype('datetime64[ns]'),
+		'x': x,
+		'y': y,
+		'x_list': x.tolist(),
+		'y_list': y.tolist(),
+		'first': first,
+		'group_starts': group_starts.tolist(),
+		'group_ends': np.append(group_starts[1:], n).tolist(),
+		'intra_dist': intra_dist
+	}
+
+def _cluster_positions(positions, distance):
+	"""This function clusters the datapoints sorted by _sort_positions (see generate_positioning_clusters)"""
+	x = positions['x']
+	y = positions['y']
+	x_list = positions['x_list']
+	y_list = positions['y_list']
+	n = len(x)
+
+	base = np.empty(n, dtype=np.int64)      #base point of the cluster of each datapoint
+	new_cluster = np.zeros(n, dtype=bool)   #datapoints that start a new cluster (except the first one of each tracker and session)
+	_find_base_points(x, y, x_list, y_list, positions['group_starts'], positions['group_ends'], distance, base, new_cluster)
+
+	return _clusters_frame(positions, base, new_cluster)
+
+def _find_base_points(x, y, x_list, y_list, group_starts, group_ends, distance, base, new_cluster):
+	"""This function finds the base point (first datapoint of the cluster) of each datapoint and the datapoints that 
+	start a new cluster, and saves them in the arrays base and new_cluster (see generate_positioning_clusters)"""
+	#CREATE CLUSTERS OF DATA POINTS (STOPS) according to the distance to the base point of each cluster.
+	#The first datapoints after a base point are checked one by one (short clusters are common in transitions) 
+	#and the rest of long clusters with array operations
+	for group_start, group_end in zip(group_starts, group_ends):
+		b = group_start
+		while b < group_end:
+			b_x1 = x_list[b]
+			b_y1 = y_list[b]
+			next_base = b + 1
+			limit = min(b + 16, group_end)
+			while next_base < limit and math.sqrt((x_list[next_base]-b_x1)**2+(y_list[next_base]-b_y1)**2) <= distance:
+				next_base = next_base + 1
+			if next_base == limit:
+				next_base = _next_base(x, y, b, limit, group_end, distance)
+			base[b:next_base] = b
+			if next_base < group_end:
+				new_cluster[next_base] = True
+			b = next_base
+
+def _cluster_parallel(positions, distance, settings, _workers):
+	"""This function clusters the datapoints sorted by _sort_positions in a pool of processes (see 
+	stops_transitions_parallel). Each process clusters a range of trackers and sessions"""
+	n = len(positions['x'])
+	arrays = {'x': positions['x'], 'y': positions['y']}
+	if (settings.stop_detection=='st_dbscan'):
+		arrays['seconds'] = _seconds(positions['timestamp'])
+		arrays['labels'] = np.full(n, -1, dtype=np.int64)
+	else:
+		arrays['base'] = np.empty(n, dtype=np.int64)
+		arrays['new_cluster'] = np.zeros(n, dtype=bool)
+
+	#ranges of whole trackers and sessions with a similar number of datapoints (several per process)
+	group_starts = np.array(positions['group_starts'], dtype=np.int64)
+	group_ends = np.array(positions['group_ends'], dtype=np.int64)
+	size = max(1, n // (_workers * 4))
+	range_ids = group_starts // size
+	ranges = []
+	for range_id in np.unique(range_ids):
+		selected = range_ids == range_id
+		start = group_starts[selected][0]
+		ranges.append((start, group_ends[selected][-1], (group_starts[selected] - start).tolist(), (group_ends[selected] - start).tolist()))
+
+	blocks, specs, shared = _share_arrays(arrays)
+	try:
+		with ProcessPoolExecutor(max_workers=_workers) as executor:
+			list(executor.map(_cluster_range, repeat(specs), ranges, repeat(distance), repeat(settings)))
+		print ("Clustering of " + str(len(group_starts)) + " sessions and trackers completed")
+		if (settings.stop_detection=='st_dbscan'):
+			base, new_cluster = _labels_to_base_points(shared['labels'].copy(), positions['first'])
+		else:
+			base = shared['base'].copy()
+			new_cluster = shared['new_cluster'].copy()
+	finally:
+		#the arrays have to be released before closing the buffers
+		shared.clear()
+		for block in blocks:
+			block.close()
+			block.unlink()
+	return _clusters_frame(positions, base, new_cluster)
+
+def _cluster_range(specs, cluster_range, distance, settings):
+	"""This function clusters a range of trackers and sessions in a process of the pool (see _cluster_parallel). 
+	The input and output arrays are in shared memory"""
+	blocks, shared = _attach_arrays(specs)
+	try:
+		_cluster_shared(shared, cluster_range, distance, settings)
+	finally:
+		#the arrays have to be released before closing the buffers
+		shared.clear()
+		for block in blocks:
+			block.close()
+
+def _cluster_shared(shared, cluster_range, distance, settings):
+	"""This function clusters a range of trackers and sessions given the shared arrays (see _cluster_range)"""
+	start, end, group_starts, group_ends = cluster_range
+	x = shared['x'][start:end]
+	y = shared['y'][start:end]
+	if (settings.stop_detection=='st_dbscan'):
+		_find_st_dbscan_labels(x, y, shared['seconds'][start:end], group_starts, group_ends, distance, 
+			settings.st_dbscan_time_window.total_seconds(), settings.st_dbscan_min_points, shared['labels'][start:end])
+	else:
+		base = shared['base'][start:end]
+		_find_base_points(x, y, x.tolist(), y.tolist(), group_starts, group_ends, distance, base, shared['new_cluster'][start:end])
+		#the base points are saved as indices of the whole array
+		base += start
+
+def _share_arrays(arrays):
+	"""This function copies numpy arrays to shared memory buffers. It returns the buffers, the specification 
+	(name, dtype and shape) of each array to attach them in other processes, and the shared arrays"""
+	blocks = []
+	specs = {}
+	shared = {}
+	for name, array in arrays.items():
+		block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+		blocks.append(block)
+		shared[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+		shared[name][...] = array
+		specs[name] = (block.name, array.dtype.str, array.shape)
+	return blocks, specs, shared
+
+def _attach_arrays(specs):
+	"""This function attaches the shared memory buffers created by _share_arrays in another process"""
+	blocks = []
+	shared = {}
+	for name, (block_name, dtype, shape) in specs.items():
+		block = shared_memory.SharedMemory(name=block_name)
+		blocks.append(block)
+		shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+	return blocks, shared
+
+def _clusters_frame(positions, base, new_cluster):
+	"""This function returns the output of generate_positioning_clusters given the base point (first datapoint of 
+	the cluster) of each datapoint and the datapoints that start a new cluster"""
+	x = positions['x']
+	y = positions['y']
+	first = positions['first']
+	timestamps = positions['timestamp']
+	n = len(x)
+
+	#sequential numbering of clusters of positioning datapoints (called in this code "group or grouping"). 
+	#The numbering starts at 1 and continues from one tracker and session to the next one
+	group = np.cumsum(new_cluster) + 1
+
+	# calculate the distance from base point (the first point in the cluster). The datapoints that start
+	# a new cluster get the distance to the base point of the previous cluster
+	previous_base = np.empty(n, dtype=np.int64)
+	previous_base[1:] = base[:-1]
+	previous_base[:1] = 0
+	base_dist = np.sqrt((x - x[previous_base]) ** 2 + (y - y[previous_base]) ** 2)
+	base_dist[first] = 0
+	# calculate the time delta from base point. It is not defined (NaT) for the datapoints that start a cluster
+	time_diff = timestamps - timestamps[base]
+	time_diff[first | new_cluster] = np.timedelta64('NaT')
+
+	df2 = pd.DataFrame({
+		'group': group,
+		'tracker': positions['tracker'],
+		'session': positions['session'],
+		'phase': positions['phase'],
+		'quantile': positions['quantile'],
+		'timestamp': timestamps,
+		'x': x,
+		'y': y,
+		'base_dist': base_dist,
+		'intra_dist': positions['intra_dist'],
+		'time_diff': time_diff
+	})
 	return (df2)
+
+def _next_base(x, y, b, start, end, distance, window=64):
+	"""This function returns the index of the first datapoint from start (and before end) which is farther than 
+	distance from the datapoint b, or end if there is not any. The datapoints are checked in windows that double 
+	in size, so long stops are scanned with a few array operations"""
+	while start < end:
+		stop = min(start + window, end)
+		far = np.sqrt((x[start:stop] - x[b]) ** 2 + (y[start:stop] - y[b]) ** 2) > distance
+		if far.any():
+			return start + int(np.argmax(far))
+		start = stop
+		window = window * 2
+	return end
 	
-def tag_clusters(df_dist):
+def _cluster_positions_st_dbscan(positions, distance, time_window, min_points):
+	"""This function clusters the datapoints sorted by _sort_positions with ST-DBSCAN (see 
+	generate_positioning_clusters). The neighbours are found with a KD-tree of each tracker and session"""
+	x = positions['x']
+	y = positions['y']
+	first = positions['first']
+	n = len(x)
+	seconds = _seconds(positions['timestamp'])
+	time_window = pd.Timedelta(time_window).total_seconds()
+
+	labels = np.full(n, -1, dtype=np.int64)    #cluster of each datapoint (-1 if it does not belong to any cluster)
+	_find_st_dbscan_labels(x, y, seconds, positions['group_starts'], positions['group_ends'], distance, time_window, min_points, labels)
+	return _clusters_frame(positions, *_labels_to_base_points(labels, first))
+
+def _find_st_dbscan_labels(x, y, seconds, group_starts, group_ends, distance, time_window, min_points, labels):
+	"""This function saves the ST-DBSCAN cluster of each datapoint of several trackers and sessions in the 
+	array labels (see _st_dbscan)"""
+	for group_start, group_end in zip(group_starts, group_ends):
+		labels[group_start:group_end] = _st_dbscan(x[group_start:group_end], y[group_start:group_end], 
+			seconds[group_start:group_end], distance, time_window, min_points)
+
+def _labels_to_base_points(labels, first):
+	"""This function returns the base point of each datapoint and the datapoints that start a new cluster given 
+	the ST-DBSCAN cluster of each datapoint: each sequence of consecutive datapoints of the same cluster is a group 
+	(and each datapoint without cluster)"""
+	n = len(labels)
+	new_cluster = np.zeros(n, dtype=bool)
+	new_cluster[1:] = (labels[1:] != labels[:-1]) | (labels[1:] == -1)
+	new_cluster &= ~first
+	base = np.maximum.accumulate(np.where(first | new_cluster, np.arange(n), 0))
+	return base, new_cluster
+
+def _seconds(timestamps):
+	"""This function returns the seconds from the first timestamp"""
+	if len(timestamps)==0:
+		return np.zeros(0)
+	return (timestamps - timestamps[0]) / np.timedelta64(1, 's')
+
+def _st_dbscan(x, y, seconds, distance, time_window, min_points):
+	"""This function returns the ST-DBSCAN cluster of each datapoint of a tracker and session (-1 if it does not 
+	belong to any cluster). The datapoints with at least min_points neighbours (closer than distance and time_window 
+	seconds apart, including themselves) are core points; core neighbours are in the same cluster, and the other 
+	neighbours of a core point are in the cluster of their closest core point in time"""
+	from scipy.spatial import cKDTree
+	from scipy.sparse import coo_matrix
+	from scipy.sparse.csgraph import connected_components
+	n = len(x)
+
+	#The time is scaled to the distance so that all the neighbours are within a sphere of radius sqrt(2)*distance.
+	#The pairs in the sphere are then filtered by distance and time
+	scale = distance / time_window if time_window > 0 else 1.0
+	tree = cKDTree(np.column_stack([x, y, seconds * scale]))
+	pairs = tree.query_pairs(distance * math.sqrt(2), output_type='ndarray')
+	i = pairs[:, 0]
+	j = pairs[:, 1]
+	neighbours = (np.sqrt((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2) <= distance) & (np.abs(seconds[i] - seconds[j]) <= time_window)
+	i = i[neighbours]
+	j = j[neighbours]
+
+	core = (np.bincount(i, minlength=n) + np.bincount(j, minlength=n) + 1) >= min_points
+	labels = np.full(n, -1, dtype=np.int64)
+
+	#clusters of core points
+	core_pairs = core[i] & core[j]
+	graph = coo_matrix((np.ones(core_pairs.sum()), (i[core_pairs], j[core_pairs])), shape=(n, n))
+	components = connected_components(graph, directed=False)[1]
+	labels[core] = components[core]
+
+	#border points (neighbours of a core point that are not core points)
+	border = core[i] != core[j]
+	points = np.where(core[i], j, i)[border]
+	cores = np.where(core[i], i, j)[border]
+	order = np.lexsort((cores, np.abs(seconds[points] - seconds[cores]), points))
+	points = points[order]
+	cores = cores[order]
+	closest = np.ones(len(points), dtype=bool)
+	closest[1:] = points[1:] != points[:-1]
+	labels[points[closest]] = labels[cores[closest]]
+	return labels
+
+def tag_clusters(df_dist,settings=None):
 	"""This function generates a data frame that identifies clusters as stops or transitions.   
-		The parameter "duration" is read from the config file and it is used to identify if a cluster 
+		The parameter "duration" is read from the settings and it is used to identify if a cluster 
 		is a stop if the dureation of that stop is larger than the time indicated in the parameter (e.g. 10 seconds)
 	
 	Parameters
@@ -256,45 +587,50 @@ def tag_clusters(df_dist):
 			tracker (identifier)
 			x and y (coordinates)
 			phase (int)
-			quantile (int) Set to 1 if not interested in using this column		
+			quantile (int) Set to 1 if not interested in using this column
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
 	Returns
 	-------
-	df_new
+	df_dist
 		returns a data frame with the following additional columns
+			time_diff2 - time difference from the first datapoint in the cluster (zero for the first one)
+			max_duration - duration of the cluster
 			type - (string) indicating if the data point belongs to a "stop" or a "transition"
+			block - identifier of the stop or transition of each tracker and session
+			delta - time difference from the previous datapoint in the block
 
 	"""
-	# Extract the number of seconds component from column "time_diff"
-	df_dist[['time_diff']] = df_dist[['time_diff']].astype(str)
-	# Get seconds from the time difference
-	df_dist['time_diff2'] = df_dist['time_diff'].str.extract('(..:..:..)', expand=True)
-	df_dist = df_dist.fillna('00:00:00')
-	df_dist['time_diff2'] = pd.to_timedelta(df_dist['time_diff2'])
-	df_dist = df_dist[['group', 'tracker', 'session', 'phase', 'quantile', 'timestamp', 'x', 'y', 'base_dist', 'intra_dist', 'time_diff2']]
+	#get parameter from the settings
+	duration= _settings.get_settings(settings).duration
+
+	return _tag_stops(_cluster_durations(df_dist), duration)
+
+def _cluster_durations(df_dist):
+	"""This function adds the columns time_diff2 and max_duration (which do not depend on the parameter 
+	duration) to a copy of the output of generate_positioning_clusters (see tag_clusters)"""
+	keys = ['tracker','session']
+
+	# Time from the first datapoint of the cluster (zero for the datapoints that start a cluster). 
+	# Only the columns in the output are copied
+	df_dist = df_dist[['group', 'tracker', 'session', 'phase', 'quantile', 'timestamp', 'x', 'y', 'base_dist', 'intra_dist']].assign(
+		time_diff2=pd.to_timedelta(df_dist['time_diff']).fillna(pd.Timedelta(0)))
 	
 	# create 'max_duration' column  - to use it to further define stops and transitions
-	df_dist['max_duration'] = df_dist.groupby(['group'])['time_diff2'].transform(max)
-	df_dist['max_duration'] = pd.to_timedelta(df_dist['max_duration'])	
+	# (the numbering of the groups continues from one tracker and session to the next one, so these are also grouped)
+	df_dist['max_duration'] = df_dist.groupby(keys + ['group'], sort=False, observed=True)['time_diff2'].transform('max')
+	return (df_dist)
+
+def _tag_stops(df_dist,duration):
+	"""This function adds the columns type, block and delta to the output of _cluster_durations (see tag_clusters)"""
+	keys = ['tracker','session']
 
 	#Add Type (Stop and Transition) column
 	#Assign stop and transition labels according to parameter duration 
-
-	#get parameter from config file
-	duration= str(config.get('parameters','duration'))
 	
 	# Tag clusters as stops or transitions
-	type = []
-	stop = pd.Timedelta(duration)
-
-	for row in df_dist['max_duration']:
-		if row >= stop:
-			type.append('stop')
-		else:
-			type.append('transition')
-			
-	# Add a column to the data frame from the list 'type'
-	df_dist['type'] = type
+	df_dist['type'] = np.where(df_dist['max_duration'] >= duration, 'stop', 'transition')
 
 	#The following code fixes the "group" column by setting the same ID for all the consecutive datapoints 
 	#labelled as transition (including clusters with less datapoints than the parameter 'duration'). 
@@ -305,75 +641,131 @@ def tag_clusters(df_dist):
 	#these transitions belong to a single transition. Consequently, this step is required so that these 
 	#transitions are labelled to belong to the same one transition. 
 	
-	#A new column "block" is added to uniquely identify the stop or transition. A block can contain multiple 'groups'
-
-	df_group = df_dist.copy()
-	df_new_group = pd.DataFrame()
-	list_tracker = df_group.tracker.unique()
-	list_session = df_group.session.unique() 
-
-	## Loop through unique group
-	for x,i in enumerate(list_tracker):
-		
-		df = df_group.copy()
-		tracker = i
-		tracker_df = df[df['tracker'] == tracker]
-		tracker_df
-	   
-		for y,j in enumerate(list_session):
-			
-			session = j
-			session_df = tracker_df[tracker_df['session'] == session]
-			  
-			session_df['block'] = (session_df.type.shift(1) != session_df.type).astype(int).cumsum()
-		
-			# SAVE
-			df_new_group = df_new_group.append(session_df)
-			
+	#A new column "block" is added to uniquely identify the stop or transition of each tracker and session 
+	#(starting from 1). A block can contain multiple 'groups'
+	type_change = (df_dist.groupby(keys, sort=False, observed=True)['type'].shift(1) != df_dist['type']).astype(int)
+	df_dist['block'] = type_change.groupby([df_dist['tracker'], df_dist['session']], sort=False, observed=True).cumsum()
+
 	#Duration between each point (by block)
 	#Since sequential transitions are relabelled as belonging to a single group. 
 	#The duration between each point needs to be recalculated as well (this since, duration resets to
-#	'00:00:00' with the distance calculation performed in function generate_positioning_clusters(df))
-	df_dur = df_new_group.copy()
-
-	tracker = df_dur.tracker.unique()
-
-	session = df_dur.session.unique()
-
-	block = df_dur.block.unique()
-
-	df_new = pd.DataFrame()
-
-	list_tracker = tracker
-	list_session = session
-	list_block = block 
-
-	for x,i in enumerate(list_tracker):
-		
-		df = df_dur.copy()
-		tracker = i
-		tracker_df = df[df['tracker'] == tracker]
-		tracker_df
-	   
-		for y,j in enumerate(list_session):
-			
-			session = j
-			session_df = tracker_df[tracker_df['session'] == session]
-
-			for z,k in enumerate(list_block):
-		
-				block = k
-				block_df = session_df[session_df['block'] == block]
-		 
-		
-				block_df['delta'] = (block_df['timestamp'] - block_df['timestamp'].shift()).fillna(pd.Timedelta('0 days'))
-		
-				# SAVE
-				df_new = df_new.append(block_df)
-		
-	return (df_new)
+	#'00:00:00' with the distance calculation performed in function generate_positioning_clusters(df))
+	df_dist['delta'] = df_dist.groupby(keys + ['block'], sort=False, observed=True)['timestamp'].diff().fillna(pd.Timedelta(0))
+
+	return (df_dist)
 	
-def get_stops_and_transitions(df_dist):
+def simplify_transitions(df_dist,settings=None):
+	"""This function simplifies the trajectory of each transition with the Ramer-Douglas-Peucker algorithm: 
+		a datapoint of a transition is removed if it is closer than the parameter "simplification_tolerance" 
+		(read from the settings) to the simplified path. The first and last datapoints of each transition, 
+		the datapoints before and after a change of phase and all the datapoints of the stops are kept. The length of the original path is kept in the column 
+		path_dist, so the distance walked (see _metricsMain.get_metrics) is the same as without simplification.
+	
+	This function reads the following parameters from the settings:
+	simplification_tolerance
+
+	Parameters
+	----------
+	df_dist : Pandas Data Frame
+		This df has to be the Data frame returned by the function: tag_clusters(df)
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
+
+	Returns
+	-------
+	df_dist
+		returns the data frame without the removed datapoints with the following additional columns
+			path_dist - length of the original path from the previous datapoint in the block (zero for the 
+				first one)
+			path_points - number of original datapoints from the previous datapoint in the block (one for 
+				the first one)
+		The columns intra_dist and delta of the transitions are calculated from the previous kept datapoint.
+
+	"""
+	tolerance = _settings.get_settings(settings).simplification_tolerance
+	keys = ['tracker', 'session', 'block']
+
+	#the datapoints of each block are contiguous in the output of tag_clusters
+	n = len(df_dist)
+	changes = np.zeros(n, dtype=bool)
+	changes[:1] = True
+	for column in keys:
+		values = np.asarray(df_dist[column])
+		changes[1:] |= values[1:] != values[:-1]
+	starts = np.flatnonzero(changes)
+	ends = np.append(starts[1:], n)
+	transition = (df_dist['type'] == 'transition').values
+	x = df_dist['x'].values.astype(np.float64)
+	y = df_dist['y'].values.astype(np.float64)
+
+	#the datapoints before and after a change of phase are kept (metrics are calculated by phase)
+	phase_changes = np.zeros(n, dtype=bool)
+	phase_changes[1:] = (df_dist['phase'].values[1:] != df_dist['phase'].values[:-1]) & ~changes[1:]
+	keep = ~transition | phase_changes | np.append(phase_changes[1:], False)
+	keep[_simplify_paths(x, y, starts[transition[starts]], ends[transition[starts]], tolerance)] = True
+
+	#length of the original path and number of datapoints from the previous kept datapoint
+	steps = np.zeros(n)
+	steps[1:] = np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2)
+	steps[changes] = 0
+	path = np.cumsum(steps)
+	kept = np.flatnonzero(keep)
+	previous = np.concatenate([[0], kept[:-1]])
+	first = changes[kept]
+	simplified = ~first & (kept - previous > 1)
+
+	df = df_dist.iloc[kept].copy()
+	df['path_dist'] = np.where(first, 0, path[kept] - path[previous])
+	df['path_points'] = np.where(first, 1, kept - previous)
+	intra_dist = df['intra_dist'].values.copy()
+	intra_dist[simplified] = np.sqrt((x[kept] - x[previous]) ** 2 + (y[kept] - y[previous]) ** 2)[simplified]
+	df['intra_dist'] = intra_dist
+	timestamps = df_dist['timestamp'].values
+	delta = df['delta'].values.copy()
+	delta[simplified] = (timestamps[kept] - timestamps[previous])[simplified]
+	df['delta'] = delta
+
+	original = int(transition.sum())
+	remaining = int(transition[kept].sum())
+	print ("Transitions simplified: " + str(remaining) + " of " + str(original) + " datapoints kept (compression ratio " + 
+		str(round(original / max(remaining, 1), 2)) + ")")
+	return (df)
+
+def _simplify_paths(x, y, starts, ends, tolerance):
+	"""This function simplifies several paths at once with the Ramer-Douglas-Peucker algorithm and returns the 
+	indices of the datapoints that are kept. The datapoints of each path are the rows start to end-1. 
+	The paths are split at their farthest datapoint from the segment between their ends (all of them at the 
+	same time) until all the datapoints are closer than the tolerance."""
+	kept = [starts, ends - 1]
+	first = starts
+	last = ends - 1
+	while len(first):
+		inner = last - first - 1
+		split = inner > 0
+		first, last, inner = first[split], last[split], inner[split]
+		if not len(first):
+			break
+		rows = _segment_rows(first + 1, inner)
+		a = np.repeat(first, inner)
+		b = np.repeat(last, inner)
+		#distance from each datapoint to the segment between the ends of its path
+		dx = x[b] - x[a]
+		dy = y[b] - y[a]
+		length = dx ** 2 + dy ** 2
+		t = np.clip(((x[rows] - x[a]) * dx + (y[rows] - y[a]) * dy) / np.where(length > 0, length, 1), 0, 1)
+		distances = np.sqrt((x[rows] - x[a] - t * dx) ** 2 + (y[rows] - y[a] - t * dy) ** 2)
+		#farthest datapoint of each path (the first one if there are several)
+		offsets = np.cumsum(inner) - inner
+		maxima = np.maximum.reduceat(distances, offsets)
+		candidates = np.where(distances == np.repeat(maxima, inner), np.arange(len(distances)), len(distances))
+		farthest = rows[np.minimum.reduceat(candidates, offsets)]
+		split = maxima > tolerance
+		kept.append(farthest[split])
+		first = np.concatenate([first[split], farthest[split]])
+		last = np.concatenate([farthest[split], last[split]])
+	return np.concatenate(kept)
+
+def get_stops_and_transitions(df_dist,segments=False):
 	"""This function generates a data frame that contains meta data about stops  (one per line) and transitions (all the lines 
 	to enable further modelling of the trajectory itself)
 	
@@ -391,6 +783,10 @@ def get_stops_and_transitions(df_dist):
 			x and y (coordinates)
 			phase (int)
 			quantile (int) Set to 1 if not interested in using this column		
+	segments : boolean
+		if True, the stops and transitions are returned as a Segments object: one row per stop and per 
+		transition, with the offsets of their datapoints in a shared positions data frame. The datapoints 
+		of the transitions are only created when needed (see Segments)
 
 	Returns
 	-------
@@ -401,102 +797,514 @@ def get_stops_and_transitions(df_dist):
 
 	"""
 
-	list_tracker = df_dist.tracker.unique()
-	list_session = df_dist.session.unique()
-	list_block = df_dist.block.unique()
-
-	#### 1) Max duration
-	#Once the sequential saccades are assign to a block, the max duration for each block is derived
-	df_max_duration = pd.DataFrame()
-
-	for x,i in enumerate(list_tracker):
-		
-		df = df_dist.copy()
-		tracker = i
-		tracker_df = df[df['tracker'] == tracker]
-		tracker_df
-	   
-		for y,j in enumerate(list_session):
-			
-			session = j
-			session_df = tracker_df[tracker_df['session'] == session]
-		  
-			session_df['max_duration'] = session_df.groupby('block')['timestamp'].transform(lambda x: x.iat[-1] - x.iat[0])
-			print(session_df['max_duration'])
-			#session_df.groupby('block')['timestamp'].transform(lambda x: x.iat[-1] - x.iat[0]).to_timedelta().total_seconds()
-
-				# SAVE
-			df_max_duration = df_max_duration.append(session_df)
-			
-	#GET STOPS
-	df_dur_fixation = df_max_duration[df_max_duration['type'] == 'stop'] # filter only stops
-
-	#GET TRANSITIONS
-	df_dur_saccades = df_max_duration[df_max_duration['type'] == 'transition'] # filter only transitions
-
-	# Extract just the block and max duration, and remove duplicate rows
-	df_duration = df_dur_fixation[['tracker', 'session', 'block', 'phase','quantile', 'max_duration', 'type']] 
-	df_duration = df_duration.drop_duplicates()
-	df_duration.sort_values(by=['tracker','session','block'], inplace=True)
-
-	df_duration = df_duration.groupby(['tracker', 'session', 'block', 'max_duration',  'type']).agg(
-		{
-			 'phase':min,   
-			 'quantile': 'first'  # get the first date per group
-		}
-	)
-	df_duration.reset_index(inplace=True)
-	df_duration.sort_values(by=['tracker','session','block'], inplace=True)
-	
-
+	keys = ['tracker', 'session', 'block']
+
+	if segments:
+		return _get_segments(df_dist)
+
+	#### 1) Stops: one row per stop with its centroid (x,y), stdev (x,y), max duration, phase, quantile and 
+	#### first and last timestamp (start and end)
+	stops = df_dist[df_dist['type'] == 'stop']
+	merge = stops.groupby(keys, sort=True, observed=True).agg(
+		x=('x', 'mean'),
+		y=('y', 'mean'),
+		x_stdev=('x', 'std'),
+		y_stdev=('y', 'std'),
+		timestamp=('timestamp', 'first'),
+		last=('timestamp', 'last'),
+		phase=('phase', 'min'),
+		quantile=('quantile', 'first')
+	).reset_index()
+	merge['max_duration'] = merge['last'] - merge['timestamp']
+	merge['type'] = 'stop'
+	merge = merge[['tracker', 'session', 'block', 'x', 'y', 'x_stdev', 'y_stdev', 'max_duration', 'type', 'phase', 'quantile', 'timestamp', 'last']]
+
+	#### 2) Transitions: all the datapoints, with the duration of the transition they belong to
+	transitions = df_dist[df_dist['type'] == 'transition']
+	timestamps = transitions.groupby(keys, sort=False, observed=True)['timestamp']
+	transitions = transitions.assign(max_duration=timestamps.transform('last') - timestamps.transform('first'))
 
+	#merge with transitions
+	merge = pd.concat([merge, transitions])
+	# order by block
+	merge = merge.sort_values(['tracker','session', 'block','timestamp'])
+	# columns that do not apply to stops or transitions are set to zero (the end of the transitions is not defined)
+	for column in merge.columns:
+		if pd.api.types.is_timedelta64_dtype(merge[column]):
+			merge[column] = merge[column].fillna(pd.Timedelta(0))
+		elif pd.api.types.is_numeric_dtype(merge[column]):
+			merge[column] = merge[column].fillna(0)
+	merge['max_duration_sec'] = merge['max_duration'].dt.total_seconds()
 
-	#### 2) Get first and last timestamp value for each block
-	# Timestamp - start and end (for entire dataset - fixation and saccades)
-	df = df_max_duration.copy()
-	df = df.groupby(['tracker', 'session', 'block'])['timestamp'].agg(['first','last'])
-	df.index = df.index.set_names(['tracker', 'session', 'block'])
-	df.reset_index(inplace=True)
-	df.rename(columns={'first':'timestamp'}, inplace=True)
-
-
-	#### 3) Centroid (x,y)
-	#Calculate centroid (mean of x and y coordinate by blocks) - only for fixation
-	test = df_dur_fixation.copy()
-
-	test2_centroid = test.groupby(['tracker', 'session', 'block'])['x','y'].agg(['mean'])
-	test2_centroid.columns = ['x', 'y'] # relabel column (x,y)
-	test2_centroid.index = test2_centroid.index.set_names(['tracker', 'session', 'block'])
-	test2_centroid.reset_index(inplace=True)
-	test2_centroid.head()
-
-	#### 4) Stdev (x,y) - only for fixation
-	test2_stdev = test.groupby(['tracker', 'session', 'block'])['x','y'].agg(['std'])
-	test2_stdev.columns = ['x_stdev', 'y_stdev'] # relabel column (x,y)
-	test2_stdev.index = test2_stdev.index.set_names(['tracker', 'session', 'block'])
-	test2_stdev.reset_index(inplace=True)
-	test2_stdev.head()
+	return (merge)
+
+def _get_segments(df_dist):
+	"""This function generates the Segments of the output of tag_clusters (see get_stops_and_transitions)"""
+	keys = ['tracker', 'session', 'block']
+
+	#the datapoints of each stop and transition have to be contiguous in the positions data frame. The output of 
+	#tag_clusters already is (trackers and sessions in order of appearance, blocks in order)
+	tracker_codes = pd.factorize(np.asarray(df_dist['tracker']))[0]
+	session_codes = pd.factorize(np.asarray(df_dist['session']))[0]
+	order = np.lexsort((df_dist['block'].values, session_codes, tracker_codes))
+	positions = df_dist.iloc[order].reset_index(drop=True)
+
+	n = len(positions)
+	changes = np.zeros(n, dtype=bool)
+	changes[:1] = True
+	for column in keys:
+		values = np.asarray(positions[column])
+		changes[1:] |= values[1:] != values[:-1]
+	starts = np.flatnonzero(changes)
+	ends = np.append(starts[1:], n)
+	segment_ids = np.cumsum(changes) - 1
+
+	#one row per stop and transition
+	segments = positions.groupby(segment_ids, sort=False).agg(
+		tracker=('tracker', 'first'),
+		session=('session', 'first'),
+		block=('block', 'first'),
+		x=('x', 'mean'),
+		y=('y', 'mean'),
+		x_stdev=('x', 'std'),
+		y_stdev=('y', 'std'),
+		type=('type', 'first'),
+		phase=('phase', 'min'),
+		quantile=('quantile', 'first'),
+		timestamp=('timestamp', 'first'),
+		last=('timestamp', 'last')
+	).reset_index(drop=True)
+	segments['max_duration'] = segments['last'] - segments['timestamp']
+	segments['max_duration_sec'] = segments['max_duration'].dt.total_seconds()
+	#the centroid and stdev are only defined for stops (stdev is zero for stops of one datapoint)
+	transition = (segments['type'] == 'transition').values
+	segments.loc[transition, ['x', 'y', 'x_stdev', 'y_stdev']] = np.nan
+	segments.loc[~transition, ['x_stdev', 'y_stdev']] = segments.loc[~transition, ['x_stdev', 'y_stdev']].fillna(0)
+	segments['start'] = starts
+	segments['end'] = ends
+	segments = segments[SEGMENTS_COLUMNS]
+
+	#the datapoints of simplified transitions (see simplify_transitions) cannot be derived from the kept ones
+	columns = POSITIONS_COLUMNS
+	if 'path_dist' in positions.columns:
+		columns = POSITIONS_COLUMNS + SIMPLIFIED_COLUMNS
+	return Segments(segments, positions[columns])
+
+#Columns of the Segments data frames
+SEGMENTS_COLUMNS = ['tracker', 'session', 'block', 'x', 'y', 'x_stdev', 'y_stdev', 'max_duration', 'type', 'phase', 'quantile', 
+	'timestamp', 'last', 'max_duration_sec', 'start', 'end']
+POSITIONS_COLUMNS = ['group', 'phase', 'quantile', 'timestamp', 'x', 'y']
+SIMPLIFIED_COLUMNS = ['base_dist', 'intra_dist', 'time_diff2', 'delta', 'path_dist', 'path_points']
+
+class Segments:
+	"""Compact output of stops_transitions (segments=True). Instead of one row per datapoint of each transition, 
+	stops and transitions are one row each (segments) with the offsets of their datapoints in a shared data frame 
+	of positions. The datapoints of the transitions are created only when they are needed.
+
+		Example:
+			st = stopsAndTransitions.stops_transitions(df_preprocessed, segments=True)
+			st.stops()                      # one row per stop, as in the output of stops_transitions
+			st.points(st.transitions())     # datapoints of the transitions, as in the output of stops_transitions
+			st.to_frame()                   # the same data frame returned by stops_transitions
+
+	Attributes
+	----------
+	segments : Pandas Data Frame
+		one row per stop and transition with the columns: tracker, session, block, x, y, x_stdev, y_stdev 
+		(centroid and stdev of the stops, NaN for transitions), max_duration, type, phase (min), quantile (first),
+		timestamp and last (first and last datapoint), max_duration_sec, start and end (the datapoints of the 
+		segment are the rows start to end-1 of positions)
+	positions : Pandas Data Frame
+		the datapoints of all the segments (those of each tracker and session are contiguous) with the columns: 
+		group, phase, quantile, timestamp, x and y. The other columns of the datapoints (base_dist, intra_dist, 
+		time_diff2 and delta) are calculated by the function points, unless the transitions were simplified 
+		(see simplify_transitions), in which case they are stored with the columns path_dist and path_points
 
-	#### 5) Tracker and Session info
-	df_tracker = df_dist.copy()
-	df_tracker = df_tracker[['block','tracker', 'session']]
-	df_tracker = df_tracker.drop_duplicates()
-	df_tracker.head()
+	"""
 
-	### 7) Merge 
-	#Create dataframe with additional information for the blocks (max duration, centroid, stdev)
+	def __init__(self,segments,positions):
+		self.segments = segments
+		self.positions = positions
+
+	def __len__(self):
+		return len(self.segments)
+
+	def stops(self):
+		"""This function returns the stops (one row each) with the columns of the output of stops_transitions"""
+		stops = self.segments.loc[self.segments['type'] == 'stop']
+		return stops.drop(columns=['start', 'end'])
+
+	def transitions(self):
+		"""This function returns the transitions (one row each, see the attribute segments)"""
+		return self.segments.loc[self.segments['type'] == 'transition']
+
+	def points(self,segments=None):
+		"""This function creates the datapoints of some segments (all the transitions by default) with the columns 
+		of the output of stops_transitions
+
+		Parameters
+		----------
+		segments : Pandas Data Frame
+			rows of the attribute segments (optional, all the transitions by default)
+
+		Returns
+		-------
+		df : Pandas Data Frame
+			one row per datapoint of the segments
+
+		"""
+		if segments is None:
+			segments = self.transitions()
+		lengths = (segments['end'] - segments['start']).values
+		rows = _segment_rows(segments['start'].values, lengths)
+
+		x = self.positions['x'].values.astype(np.float64)
+		y = self.positions['y'].values.astype(np.float64)
+		timestamps = self.positions['timestamp'].values
+		group = self.positions['group'].values
+		n = len(x)
+
+		#first datapoint of each tracker and session, of each segment and of each cluster (group)
+		first = np.zeros(n, dtype=bool)
+		first[self.segments['start'].values[_first_segments(self.segments)]] = True
+		segment_start = np.zeros(n, dtype=bool)
+		segment_start[self.segments['start'].values] = True
+		cluster_start = first.copy()
+		cluster_start[1:] |= group[1:] != group[:-1]
+		#base point (first datapoint of the cluster) of each datapoint and of the previous datapoint
+		base = np.maximum.accumulate(np.where(cluster_start, np.arange(n), 0))
+		previous_base = np.concatenate([[0], base[:-1]])
+		previous = np.maximum(rows - 1, 0)
+
+		df = self.positions.iloc[rows].reset_index(drop=True)
+		segment_columns = segments[['tracker', 'session', 'block', 'type', 'max_duration', 'max_duration_sec']]
+		for column in segment_columns.columns:
+			df[column] = np.repeat(segment_columns[column].values, lengths)
+		df['x_stdev'] = 0.0
+		df['y_stdev'] = 0.0
+		df['last'] = pd.NaT
+		#these columns are only stored in positions if the transitions were simplified (see simplify_transitions)
+		if 'base_dist' not in df.columns:
+			df['base_dist'] = np.where(first[rows], 0, np.sqrt((x[rows] - x[previous_base[rows]]) ** 2 + (y[rows] - y[previous_base[rows]]) ** 2))
+			df['intra_dist'] = np.where(first[rows], 0, np.sqrt((x[rows] - x[previous]) ** 2 + (y[rows] - y[previous]) ** 2))
+			df['time_diff2'] = timestamps[rows] - timestamps[base[rows]]
+			df['delta'] = np.where(segment_start[rows], np.timedelta64(0, 'ns'), timestamps[rows] - timestamps[previous])
+		df['group'] = df['group'].astype(np.float64)
+		return df[self._columns()]
+
+	def _columns(self):
+		"""This function returns the columns of the output of stops_transitions"""
+		if 'path_dist' in self.positions.columns:
+			return STOPS_TRANSITIONS_COLUMNS[:-1] + ['path_dist', 'path_points'] + STOPS_TRANSITIONS_COLUMNS[-1:]
+		return STOPS_TRANSITIONS_COLUMNS
+
+	def to_frame(self):
+		"""This function returns the stops and transitions in the format of the output of stops_transitions 
+		(one row per stop and one row per datapoint of each transition)"""
+		stops = self.stops().assign(group=0.0, base_dist=0.0, intra_dist=0.0, time_diff2=pd.Timedelta(0), delta=pd.Timedelta(0), 
+			path_dist=0.0, path_points=0)
+		df = pd.concat([stops[self._columns()], self.points()], ignore_index=True)
+		return df.sort_values(['tracker','session', 'block','timestamp']).reset_index(drop=True)
+
+	def transition_distances(self):
+		"""This function returns the distance (in meters) from each datapoint of the transitions to the previous 
+		datapoint of the same tracker and session, where the previous datapoint of the first datapoint of a transition 
+		is the centroid of the previous stop (as in the output of stops_transitions)
+
+		Returns
+		-------
+		df : Pandas Data Frame
+			one row per datapoint of the transitions with the columns: session, tracker, phase, block, 
+			distance_previous_point_meter and path_points (number of original datapoints, see simplify_transitions)
+
+		"""
+		segments = self.segments
+		transitions = (segments['type'] == 'transition').values
+		lengths = (segments['end'] - segments['start']).values[transitions]
+		starts = segments['start'].values[transitions]
+		rows = _segment_rows(starts, lengths)
+		x = self.positions['x'].values.astype(np.float64)
+		y = self.positions['y'].values.astype(np.float64)
+
+		distances = np.zeros(len(rows))
+		distances[1:] = np.sqrt((x[rows[1:]] - x[rows[:-1]]) ** 2 + (y[rows[1:]] - y[rows[:-1]]) ** 2) / 1000
+		points = np.ones(len(rows), dtype=np.int64)
+		if 'path_dist' in self.positions.columns:
+			#length of the original path of simplified transitions (see simplify_transitions)
+			distances = self.positions['path_dist'].values[rows].astype(np.float64) / 1000
+			points = self.positions['path_points'].values[rows]
+		#first datapoint of each transition: distance to the centroid of the previous stop of the same tracker and session
+		first = np.cumsum(lengths) - lengths
+		previous = np.flatnonzero(transitions) - 1
+		same = (previous >= 0)
+		previous = np.maximum(previous, 0)
+		same &= (segments['tracker'].values[previous] == segments['tracker'].values[transitions]) & \
+			(segments['session'].values[previous] == segments['session'].values[transitions]) & \
+			(segments['type'].values[previous] == 'stop')
+		previous_x = segments['x'].values[previous].astype(np.float64)
+		previous_y = segments['y'].values[previous].astype(np.float64)
+		distances[first] = np.where(same, np.sqrt((previous_x - x[starts]) ** 2 + (previous_y - y[starts]) ** 2) / 1000, 0)
+
+		return pd.DataFrame({
+			'session': np.repeat(segments['session'].values[transitions], lengths),
+			'tracker': np.repeat(segments['tracker'].values[transitions], lengths),
+			'phase': self.positions['phase'].values[rows],
+			'block': np.repeat(segments['block'].values[transitions], lengths),
+			'distance_previous_point_meter': distances,
+			'path_points': points
+		})
+
+def _segment_rows(starts, lengths):
+	"""This function returns the rows of positions of segments given their start and number of datapoints"""
+	return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+def _first_segments(segments):
+	"""This function returns a boolean array with the first segment of each tracker and session"""
+	first = np.ones(len(segments), dtype=bool)
+	changes = np.zeros(len(segments) - 1, dtype=bool) if len(segments) else np.zeros(0, dtype=bool)
+	for column in ['tracker', 'session']:
+		values = np.asarray(segments[column])
+		changes |= values[1:] != values[:-1]
+	first[1:] = changes
+	return first
+
+#Columns of the data frame returned by stops_transitions (and by StopDetector)
+STOPS_TRANSITIONS_COLUMNS = ['tracker', 'session', 'block', 'x', 'y', 'x_stdev', 'y_stdev', 'max_duration', 'type', 'phase', 'quantile', 
+	'timestamp', 'last', 'group', 'base_dist', 'intra_dist', 'time_diff2', 'delta', 'max_duration_sec']
+
+class StopDetector:
+	"""This class detects stops and transitions while the positioning datapoints arrive, one datapoint or a small 
+	batch at a time, using the same rules as generate_positioning_clusters and tag_clusters: a cluster starts when a 
+	datapoint is farther than the parameter "distance" from the first datapoint of the current cluster, a cluster is 
+	a stop if it lasts at least the parameter "duration", and consecutive clusters of the same type are one block.
+
+	A stop or transition is returned once it is finished (when the next block starts or flush is called), with 
+	the same columns as the output of stops_transitions: one row per stop and one row per datapoint of a transition.
+	The centroid and stdev of the stops are calculated incrementally (Welford's algorithm), so each datapoint is 
+	processed in constant time and the memory used by each tracker does not grow with the length of a stop (the 
+	datapoints of a transition are kept until the transition finishes).
+
+	If all the datapoints are processed in the order used by generate_positioning_clusters (trackers and sessions in 
+	order of appearance), the rows returned are the same as the output of stops_transitions.
+
+		Example:
+			detector = stopsAndTransitions.StopDetector()
+			df_new = detector.update(df_chunk)      # finished stops and transitions, every time new data arrives
+			df_new = detector.flush()              # at the end of the session
 
-	#remove phase and quartile; add timestamp (start time and end time)  <--------------------------------avoid doing this!
-	merge = pd.merge(pd.merge(test2_centroid,test2_stdev,on=['tracker','session','block']),df_duration,on=['tracker','session','block'])
+	Parameters
+	----------
+	settings : Settings
+		parameters of the scripts (optional, read from ../info.ini by default)
 
-	#Merge with start and end timestamp
-	merge = pd.merge(merge,df,on=['tracker','session','block'])
+	"""
 
-	#merge with transitions
-	merge = merge.append(df_dur_saccades)
-	# order by block
-	merge = merge.sort_values(['tracker','session', 'block','timestamp'])
-	merge = merge.fillna(0)
-	merge['max_duration_sec'] = merge['max_duration'].dt.total_seconds()
+	def __init__(self,settings=None):
+		settings = _settings.get_settings(settings)
+		self.distance = settings.distance
+		self.duration = settings.duration.value
+		#state of each tracker and session: {(tracker, session): _TrackerState}
+		self.states = {}
+		#last block of each tracker and session that was flushed: {(tracker, session): int}, so that the numbering 
+		#of the blocks continues if more datapoints of that tracker and session arrive
+		self.blocks = {}
+		#sequential numbering of the clusters (see generate_positioning_clusters)
+		self.group = 1
+		#Data Frame returned when no stop or transition finished
+		self.empty = None
+
+	def update(self,df):
+		"""This function processes new positioning datapoints
+
+		Parameters
+		----------
+		df : Pandas Data Frame
+			the new datapoints (preprocessed, see stops_transitions) in chronological order for each tracker and session. 
+			Datapoints without coordinates are ignored
+
+		Returns
+		-------
+		df : Pandas Data Frame
+			the stops and transitions that finished with these datapoints (see stops_transitions)
+
+		"""
+		rows = []
+		for tracker, session, timestamp, x, y, phase, quantile in df[['tracker', 'session', 'timestamp', 'x', 'y', 'phase', 'quantile']].itertuples(index=False):
+			self.add(tracker, session, timestamp, x, y, phase, quantile, rows)
+		return self._to_frame(rows)
+
+	def add(self,tracker,session,timestamp,x,y,phase,quantile,rows=None):
+		"""This function processes one positioning datapoint. It returns the list of rows (dictionaries with the columns 
+		of stops_transitions) of the stops and transitions that finished with this datapoint. If a list of rows is 
+		given, they are appended to it. Timestamps can be given as pandas Timestamps or as nanoseconds. Datapoints 
+		without coordinates (NaN) are ignored. This is the fastest way to process a single datapoint."""
+		if rows is None:
+			rows = []
+		x = float(x)
+		y = float(y)
+		if math.isnan(x) or math.isnan(y):
+			return rows
+		timestamp = pd.Timestamp(timestamp).value if not isinstance(timestamp, int) else timestamp
+		phase = int(phase)
+		quantile = int(quantile)
+		state = self.states.get((tracker, session))
+		if state is None:
+			#first datapoint of a tracker and session: it starts a cluster (the numbering of the clusters continues)
+			state = _TrackerState(tracker, session, self.blocks.pop((tracker, session), 0))
+			self.states[(tracker, session)] = state
+			state.start_cluster(self.group, timestamp, x, y)
+			base_dist = 0.0
+			intra_dist = 0.0
+		else:
+			# calculate the distance from previous point and from base point (the first point in the cluster)
+			intra_dist = math.sqrt((x-state.previous_x)**2+(y-state.previous_y)**2)
+			base_dist = math.sqrt((x-state.base_x)**2+(y-state.base_y)**2)
+			if base_dist > self.distance:
+				#the datapoint is in another cluster
+				self._end_cluster(state, rows)
+				self.group = self.group + 1
+				state.start_cluster(self.group, timestamp, x, y)
+
+		state.previous_x = x
+		state.previous_y = y
+		time_diff = timestamp - state.base_time
+		state.cluster_duration = max(state.cluster_duration, time_diff)
+		point = {'group': state.cluster_group, 'phase': phase, 'quantile': quantile, 'timestamp': timestamp, 'x': x, 'y': y,
+			'base_dist': base_dist, 'intra_dist': intra_dist, 'time_diff2': time_diff}
+
+		if state.cluster_is_stop:
+			state.add_to_stop(point)
+		else:
+			state.cluster_points.append(point)
+			if state.cluster_duration >= self.duration:
+				#the cluster lasts enough to be a stop
+				state.cluster_is_stop = True
+				if state.block_type != 'stop':
+					self._end_block(state, rows)
+					state.start_block('stop')
+				for point in state.cluster_points:
+					state.add_to_stop(point)
+				state.cluster_points = []
+		return rows
+
+	def flush(self,tracker=None,session=None):
+		"""This function finishes the current stop or transition of a tracker and session (e.g. at the end of a session).
+		If tracker and session are not given, all of them are finished. The next datapoints of a finished tracker 
+		and session start a new cluster (the numbering of their blocks continues).
+
+		Returns
+		-------
+		df : Pandas Data Frame
+			the stops and transitions that were finished (see stops_transitions)
+
+		"""
+		rows = []
+		for key in list(self.states):
+			if (tracker is None or key[0] == tracker) and (session is None or key[1] == session):
+				state = self.states.pop(key)
+				self._end_cluster(state, rows)
+				self._end_block(state, rows)
+				self.blocks[key] = state.block
+		return self._to_frame(rows)
+
+	def _end_cluster(self,state,rows):
+		"""This function adds the datapoints of a finished cluster that is not a stop to the current transition"""
+		if state.cluster_is_stop:
+			return
+		if state.block_type != 'transition':
+			self._end_block(state, rows)
+			state.start_block('transition')
+		state.transition_points.extend(state.cluster_points)
+		state.cluster_points = []
+
+	def _end_block(self,state,rows):
+		"""This function appends the rows of the current stop or transition of a tracker and session to rows"""
+		if state.block_type == 'stop':
+			rows.append(state.stop_row())
+		elif state.block_type == 'transition':
+			rows.extend(state.transition_rows())
+		state.block_type = None
+
+	def _to_frame(self,rows):
+		"""This function converts a list of rows into a Data Frame with the columns of stops_transitions"""
+		if len(rows)==0 and self.empty is not None:
+			return self.empty.copy()
+		df = pd.DataFrame(rows, columns=STOPS_TRANSITIONS_COLUMNS)
+		for column in ['max_duration', 'time_diff2', 'delta']:
+			df[column] = pd.to_timedelta(df[column], unit='ns').astype('timedelta64[ns]')
+		for column in ['timestamp', 'last']:
+			df[column] = pd.to_datetime(df[column], unit='ns').astype('datetime64[ns]')
+		for column in ['x', 'y', 'x_stdev', 'y_stdev', 'group', 'base_dist', 'intra_dist']:
+			df[column] = df[column].astype(np.float64)
+		for column in ['block', 'phase', 'quantile']:
+			df[column] = df[column].astype(np.int64)
+		df['max_duration_sec'] = df['max_duration'].dt.total_seconds()
+		if len(rows)==0:
+			self.empty = df
+		return df
+
+class _TrackerState:
+	"""Current cluster and block of a tracker and session (used by StopDetector)"""
+
+	def __init__(self,tracker,session,block=0):
+		self.tracker = tracker
+		self.session = session
+		self.block = block
+		self.block_type = None
+
+	def start_cluster(self,group,timestamp,x,y):
+		self.cluster_group = group
+		self.cluster_is_stop = False
+		self.cluster_points = []
+		self.cluster_duration = 0
+		self.base_time = timestamp
+		self.base_x = x
+		self.base_y = y
+
+	def start_block(self,block_type):
+		self.block = self.block + 1
+		self.block_type = block_type
+		self.transition_points = []
+		#Welford's algorithm for the centroid and stdev of a stop
+		self.n = 0
+		self.mean_x = 0.0
+		self.mean_y = 0.0
+		self.m2_x = 0.0
+		self.m2_y = 0.0
+
+	def add_to_stop(self,point):
+		if self.n == 0:
+			self.first = point['timestamp']
+			self.phase = point['phase']
+			self.quantile = point['quantile']
+		self.n = self.n + 1
+		dx = point['x'] - self.mean_x
+		self.mean_x = self.mean_x + dx / self.n
+		self.m2_x = self.m2_x + dx * (point['x'] - self.mean_x)
+		dy = point['y'] - self.mean_y
+		self.mean_y = self.mean_y + dy / self.n
+		self.m2_y = self.m2_y + dy * (point['y'] - self.mean_y)
+		self.last = point['timestamp']
+		self.phase = min(self.phase, point['phase'])
+
+	def stop_row(self):
+		x_stdev = math.sqrt(self.m2_x / (self.n - 1)) if self.n > 1 else 0.0
+		y_stdev = math.sqrt(self.m2_y / (self.n - 1)) if self.n > 1 else 0.0
+		return {'tracker': self.tracker, 'session': self.session, 'block': self.block, 'x': self.mean_x, 'y': self.mean_y, 
+			'x_stdev': x_stdev, 'y_stdev': y_stdev, 'max_duration': self.last - self.first, 'type': 'stop', 'phase': self.phase, 
+			'quantile': self.quantile, 'timestamp': self.first, 'last': self.last, 'group': 0, 'base_dist': 0.0, 'intra_dist': 0.0, 
+			'time_diff2': 0, 'delta': 0}
+
+	def transition_rows(self):
+		points = self.transition_points
+		duration = points[-1]['timestamp'] - points[0]['timestamp']
+		rows = []
+		previous = points[0]['timestamp']
+		for point in points:
+			row = dict(point, tracker=self.tracker, session=self.session, block=self.block, x_stdev=0.0, y_stdev=0.0, 
+				max_duration=duration, type='transition', last=None, delta=point['timestamp'] - previous)
+			previous = point['timestamp']
+			rows.append(row)
+		self.transition_points = []
+		return rows
 
-	return (merge)
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 This script provides general functions  
 i) to open and read files and create Pandas Data Frames
+ii) to convert data frames to compact data types and measure their memory footprint
 
 This script requires that `pandas` be installed within the Python
 environment you are running this script in.
@@ -9,16 +10,37 @@ environment you are running this script in.
 This file can also be imported as a module and contains the following
 functions:
 
-    * sampling_and_interpolating - for (down) smapling and interpolating a positioning dataset
-    * calculate_rotation - for adding a new column Rotation in degrees if the dataset contains rotation information in radians
-	* add_phases - for adding a new column with Phase information based on a PHASES Data Frame
-	* add_quantiles - for adding a new column with "quantile" information: quantiles are artifitial divisions of data points within 
-	a phase in X number of equal parts according to their timestamp
+	* open_csv_gui - opens a CSV file selected by the user
+	* open_csv - opens a CSV file and parses its date columns
+	* compact_dtypes - converts the columns of a data frame of the pipeline to memory-lean data types
+	* memory_footprint - measures the memory used by a data frame at a stage of the pipeline
+	* add_memory_footprint - appends the memory footprint of a stage to a memory report (if the report is enabled)
+	* gui_open_file - dialog to select a file
 """
 
 from PyQt5.QtWidgets import QFileDialog
+import numpy as np
 import pandas as pd 
 
+#Format of ALL the timestamps in the CSV files
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+#Compact data types for the columns of the positioning datasets (used if compact_dtypes=True)
+COMPACT_DTYPES = {
+	'session': 'category',
+	'tracker': 'category',
+	'x': np.float32,
+	'y': np.float32,
+	'phase': np.int8,
+	'quantile': np.int8
+}
+
+#Columns converted to compact data types by the function compact_dtypes
+CATEGORY_COLUMNS = ['session', 'tracker', 'type', 'tag', 'obj_type']
+FLOAT32_COLUMNS = ['x', 'y', 'x_stdev', 'y_stdev', 'base_dist', 'intra_dist', 'rotation']
+SMALL_INT_COLUMNS = ['phase', 'quantile']
+DATETIME_COLUMNS = ['timestamp', 'last']
+
 def open_csv_gui():
 	"""This function opens a CSV file selected by a user using an open dialogue. 
 		Timestamps MUST be formatted as "%d/%m/%Y %H:%M:%S" 	
@@ -30,11 +52,10 @@ def open_csv_gui():
 
 	"""
 	source_file=gui_open_file()
-	mydateparser = lambda x: pd.datetime.strptime(x, "%d/%m/%Y %H:%M:%S")
-	df = pd.read_csv(source_file, low_memory=False, parse_dates=['timestamp'], date_parser=mydateparser)
+	df = open_csv(source_file, ['timestamp'])
 	return df
 
-def open_csv(source_file, list_of_date_columns):
+def open_csv(source_file, list_of_date_columns, compact_dtypes=False):
 	"""This function opens a CSV file selected by a user using an open dialogue. 
 		Timestamps MUST be formatted as "%d/%m/%Y %H:%M:%S"
 	Parameters
@@ -43,6 +64,9 @@ def open_csv(source_file, list_of_date_columns):
 		full filename of the csv file to be opened: e.g. "D:/moodoo/Dataset_Study-layers-2019-2_PHASES_2019_FIXED.csv"
 	list_of_date_columns: list of strings
 		list of names of columns with datetime data: e.g.  ['start', 'end']. Timestamps MUST be formatted as "%d/%m/%Y %H:%M:%S"
+	compact_dtypes: boolean
+		If True, the columns in COMPACT_DTYPES are loaded with compact data types: categorical 'session' and 
+		'tracker', float32 'x' and 'y' and int8 'phase' and 'quantile' (optional, False by default)
 			
 	Returns
 	-------
@@ -50,11 +74,97 @@ def open_csv(source_file, list_of_date_columns):
 		a data frame with the content of the CSV file
 
 	"""
+	dtype = COMPACT_DTYPES if compact_dtypes else None
+	df = pd.read_csv(source_file, low_memory=False, dtype=dtype)
+	#parse all the values of each date column at once with the known format
+	for column in list_of_date_columns:
+		df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+	return df
+
+
+def compact_dtypes(df):
+	"""This function converts the columns of a data frame of the pipeline (preprocessed dataset, stops and 
+	transitions, etc.) to memory-lean data types: 
+		categorical identifiers (session, tracker, type, tag, obj_type), 
+		float32 coordinates and distances (x, y, x_stdev, y_stdev, base_dist, intra_dist, rotation), 
+		int8 or int16 phase and quantile, 
+		boolean interpolated and 
+		datetime64 timestamps.
+	Columns that are not in the data frame are ignored.
+
+	Parameters
+	----------
+	df : Pandas Data Frame
+		any data frame of the pipeline
 
-	mydateparser = lambda x: pd.datetime.strptime(x, "%d/%m/%Y %H:%M:%S")
-	df = pd.read_csv(source_file, low_memory=False, parse_dates=list_of_date_columns, date_parser=mydateparser)
+	Returns
+	-------
+	df : Pandas Data Frame
+		a copy of the data frame with the compact data types
+
+	"""
+	dtypes = {}
+	for column in df.columns:
+		if column in CATEGORY_COLUMNS:
+			dtypes[column] = 'category'
+		elif column in FLOAT32_COLUMNS:
+			dtypes[column] = np.float32
+		elif column in SMALL_INT_COLUMNS and df[column].notna().all():
+			values = df[column]
+			if len(values)==0 or (values.min() >= np.iinfo(np.int8).min and values.max() <= np.iinfo(np.int8).max):
+				dtypes[column] = np.int8
+			else:
+				dtypes[column] = np.int16
+		elif column == 'interpolated' and df[column].dtype != bool:
+			dtypes[column] = bool
+	df = df.astype(dtypes)
+	for column in DATETIME_COLUMNS:
+		if column in df.columns and df[column].dtype == object:
+			df[column] = pd.to_datetime(df[column], errors='coerce')
 	return df
 
+def memory_footprint(stage, df):
+	"""This function measures the memory used by a data frame (including the content of strings) 
+	at a given stage of the pipeline. 
+
+	Parameters
+	----------
+	stage : string
+		name of the stage (e.g. 'add_phases')
+	df : Pandas Data Frame
+		the output of the stage
+
+	Returns
+	-------
+	footprint : dict
+		stage, rows, columns and memory_MB. A list of these dictionaries can be converted into a 
+		report with pd.DataFrame(list_of_footprints)
+
+	"""
+	return {
+		'stage': stage,
+		'rows': len(df),
+		'columns': len(df.columns),
+		'memory_MB': float(df.memory_usage(index=True, deep=True).sum()) / 2**20
+	}
+
+def add_memory_footprint(memory_report, stage, df):
+	"""This function appends the memory footprint of a stage (see memory_footprint) to a memory report. 
+	Nothing is measured if the report is None (the parameter memory_report is 0), because measuring the content 
+	of the strings of large data frames takes a long time.
+
+	Parameters
+	----------
+	memory_report : list or None
+		list of footprints of the previous stages
+	stage : string
+		name of the stage (e.g. 'add_phases')
+	df : Pandas Data Frame
+		the output of the stage
+
+	"""
+	if memory_report is not None:
+		memory_report.append(memory_footprint(stage, df))
 
 def gui_open_file(dir=None):
 	"""This function enables the user to select a file via a dialog and return the file name
@@ -10,10 +10,9 @@ import _util as util
 #import _preprocessing as preprocessing
 import _entropy as entropy
 
-import configparser
+import _settings
 #load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+settings = _settings.load('../info.ini')
 
 currentDT = datetime.datetime.now()
 folderName = currentDT.strftime("%Y-%m-%d_%H:%M:%S")
@@ -26,10 +25,10 @@ df=util.open_csv("sample_output_files/PartialDatasets_NOTEBOOK1_classroom_data_V
 
 print ("Calculate entropy by session and tracker and phase")
 #Calculate entropy by session and tracker
-df3=entropy.calculate_entropy_session_tracker_phase(df)
+df3=entropy.calculate_entropy_session_tracker_phase(df,settings)
 
 #Get the size of the cell to include in the file name
-size_of_grid_cells= float(config.get('parameters','size_of_grid_cells'))
+size_of_grid_cells= settings.size_of_grid_cells
 
 print ("Saving files")
 filename = time.strftime('Output_NOTEBOOK7_entropy_BY_PHASE_grouping_gridsize_'+str(size_of_grid_cells)+'mm_%Y-%m-%d-%H-%M.csv')
@@ -1,7 +1,6 @@
 import sys
 sys.path.insert(0, '../scripts')
 
-import configparser
 import numpy as np 
 import pandas as pd 
 import csv
@@ -10,10 +9,10 @@ import time
 import datetime
 import _util as util
 import _metricsMain as main
+import _settings
 
 #load parameters
-config = configparser.ConfigParser()
-config.read('../info.ini')
+settings = _settings.load('../info.ini')
 
 currentDT = datetime.datetime.now()
 folderName = currentDT.strftime("%Y-%m-%d_%H:%M:%S")
@@ -40,13 +39,13 @@ df_giniSession=util.open_csv("sample_output_files/Output_NOTEBOOK9_gini_grouping
 
 ###Parameters to generate the metrics
 selectedPhase=-99 #if results from all the phases are to be included set to -99, otherwise, indicate the particular phase of interest (e.g. 1, 2, 3...)
-weighted=1 #if weighted is set to 1, all the metrics are normalised with reference to the shortest duration of each phase. Set to 0 to get the metrics for each session/phase of variable durations.
+settings=settings.replace(weighted=1) #if weighted is set to 1, all the metrics are normalised with reference to the shortest duration of each phase. Set to 0 to get the metrics for each session/phase of variable durations.
 
 
 ###GENERATE THE METRICS
-Output=main.get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,selectedPhase)
+Output=main.get_metrics(df_fs,df_points,df_entropy,df_giniT,df_giniSession,df_phases,selectedPhase,settings)
 
-if(weighted==1):
+if(settings.weighted==1):
     file = time.strftime('Output_NOTEBOOK10_metrics_per_tracker_WEIGHTED_%Y-%m-%d-%H-%M.csv')
 else:
     file = time.strftime('Output_NOTEBOOK10_metrics_per_tracker_%Y-%m-%d-%H-%M.csv')
@@ -8,7 +8,6 @@ To test the functions and generate intermediate output files, run the files l de
 import sys
 sys.path.insert(0, '../scripts')
 
-import configparser
 import numpy as np 
 import pandas as pd 
 import csv
@@ -22,10 +21,12 @@ import _stopsAndTransitions as stopsAndTransitions
 import _entropy as entropy
 import _metricsMain as main
 import _classroomObjects as classroomObjects
+import _proximity as proximity
+import _cache as cache
+import _settings
 
 #LOAD PARAMETERS
-config = configparser.ConfigParser()
-config.read('../info.ini')
+settings = _settings.load('../info.ini')
 
 currentDT = datetime.datetime.now()
 folderName = currentDT.strftime("%Y-%m-%d_%H:%M:%S")
@@ -33,8 +34,6 @@ folderName
 
 #LOAD DATASET
 
-#Load LOCALISATION DATASET
-df=util.open_csv("Merged dataset 2018-2019/demo_dataset_2019.csv", ['timestamp'])
 #Load PHASES 
 dfPhases=util.open_csv("Merged dataset 2018-2019/demo_phases_2019.csv", ['start', 'end'])
 #Load fixed points (OBJECTS and STUDENTS/GROUPS OF STDUENTS)
@@ -43,7 +42,9 @@ dfFixedPoints=util.open_csv("Merged dataset 2018-2019/demo_fixed_points_2019.csv
 
 
 '''PREPROCESSING'''
-df_preprocessed=preprocessing.preprocessing(df,dfPhases,1,0)
+#The preprocessed dataset is loaded from the "cache" folder if the same files and parameters were already preprocessed
+df_preprocessed=cache.preprocessing_cached("Merged dataset 2018-2019/demo_dataset_2019.csv", 
+	"Merged dataset 2018-2019/demo_phases_2019.csv",1,0)
 
 '''STOPS AND TRANSITIONS'''
 df_stops_transitions=stopsAndTransitions.stops_transitions(df_preprocessed)
@@ -60,19 +61,23 @@ gini_output_joint_trackers=classroomObjects.calculate_gini_trackers_together(fix
 
 '''ENTROPY'''
 #Calculate entropy by tracker and phase
-entropy_output=entropy.calculate_entropy_session_tracker_phase(df)
+entropy_output=entropy.calculate_entropy_session_tracker_phase(df_preprocessed)
 
 #Generate charts that can be associated to entropy (Voronoi, ConvexHull and Delaunay)
 entropy.plot_charts_per_tracker(df_stops_transitions)
 
+'''PROXIMITY BETWEEN TRACKERS'''
+#Calculate co-presence time and mean distance of each pair of trackers by phase
+proximity_output=proximity.calculate_proximity_by_pair(df_preprocessed)
+
 '''GET METRICS'''
 ###GENERATE THE METRICS
 selectedPhase=-99 #if results from all the phases are to be included set to -99, otherwise, indicate the particular phase of interest (e.g. 1, 2, 3...)
 
 Output=main.get_metrics(df_stops_transitions,fixed_points_stats,entropy_output,gini_output_separate_trackers
-	,gini_output_joint_trackers,dfPhases,selectedPhase)
+	,gini_output_joint_trackers,dfPhases,selectedPhase,df_proximity=proximity_output)
 
-weighted= int(config.get('parameters','weighted'))
+weighted= settings.weighted
 if(weighted==1):
     file = time.strftime('Output_NOTEBOOK10_metrics_per_tracker_WEIGHTED_%Y-%m-%d-%H-%M.csv')
 else:
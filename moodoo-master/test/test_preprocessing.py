@@ -0,0 +1,60 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import numpy as np 
+import pandas as pd 
+import _preprocessing as preprocessing
+
+
+def datapoints(times, session='S0'):
+	return pd.DataFrame({
+		'session': session,
+		'tracker': 'T0',
+		'timestamp': pd.to_datetime(times),
+		'x': 0.0,
+		'y': 0.0
+	})
+
+
+def phases(rows):
+	return pd.DataFrame(rows, columns=['session', 'phase', 'start', 'end']).astype({'start': 'datetime64[ns]', 'end': 'datetime64[ns]'})
+
+
+def first_phase_in_file(df, dfPhases):
+	"""The phase of each datapoint as the first phase of the file that contains it"""
+	result = []
+	for session, timestamp in zip(df['session'], df['timestamp']):
+		found = dfPhases.loc[(dfPhases['session'] == session) & (dfPhases['start'] <= timestamp) & (timestamp <= dfPhases['end']) & (dfPhases['phase'] != 0)]
+		result.append(found['phase'].values[0] if len(found) > 0 else -100)
+	return result
+
+
+def test_add_phases_nested_phases():
+	dfPhases = phases([
+		('S0', 1, '2019-04-04 10:00', '2019-04-04 11:40'),
+		('S0', 2, '2019-04-04 10:50', '2019-04-04 11:00')
+	])
+	df = datapoints(['2019-04-04 09:59', '2019-04-04 10:10', '2019-04-04 10:55', '2019-04-04 11:10', '2019-04-04 11:41'])
+	df = preprocessing.add_phases(df, dfPhases, 1)
+	assert list(df['phase']) == [-100, 1, 1, 1, -100]
+
+	#datapoints of a phase are not removed when only datapoints out of any phase are excluded
+	df = preprocessing.add_phases(datapoints(['2019-04-04 10:10', '2019-04-04 12:00']), dfPhases, 0)
+	assert list(df['phase']) == [1]
+
+
+def test_add_phases_first_phase_in_file():
+	dfPhases = phases([
+		('S0', 2, '2019-04-04 10:30', '2019-04-04 11:00'),
+		('S0', 1, '2019-04-04 10:00', '2019-04-04 10:30'),
+		('S0', 0, '2019-04-04 09:00', '2019-04-04 12:00'),
+		('S0', 3, '2019-04-04 10:45', '2019-04-04 11:30'),
+		('S1', 1, '2019-04-04 10:00', '2019-04-04 10:20'),
+		('S1', 2, '2019-04-04 10:21', '2019-04-04 10:40')
+	])
+	times = pd.date_range('2019-04-04 09:50', '2019-04-04 11:40', freq='30s')
+	df = pd.concat([datapoints(times, 'S0'), datapoints(times, 'S1'), datapoints(times, 'S2')], ignore_index=True)
+	expected = first_phase_in_file(df, dfPhases)
+	df = preprocessing.add_phases(df, dfPhases, 1)
+	assert list(df['phase']) == expected
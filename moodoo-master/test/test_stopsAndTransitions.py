@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import numpy as np 
+import pandas as pd 
+import _settings
+import _stopsAndTransitions as stopsAndTransitions
+
+
+def positions(tracker='T0', session='S0'):
+	"""Datapoints (1 Hz) of a tracker that stops at three places for 30 seconds and walks between them"""
+	places = [(0, 0), (5000, 0), (5000, 5000)]
+	xy = []
+	for index, (x, y) in enumerate(places):
+		xy += [(x, y)] * 30
+		if index < len(places) - 1:
+			next_x, next_y = places[index + 1]
+			xy += [(x + (next_x - x) * step / 5, y + (next_y - y) * step / 5) for step in range(1, 5)]
+	xy = np.array(xy, dtype=np.float64)
+	return pd.DataFrame({
+		'tracker': tracker,
+		'session': session,
+		'timestamp': pd.date_range('2019-04-04 08:40:00', periods=len(xy), freq='1s'),
+		'x': xy[:, 0],
+		'y': xy[:, 1],
+		'phase': 1,
+		'quantile': 1
+	})
+
+
+def test_flush_in_the_middle_of_a_session_keeps_block_ids_unique():
+	df = positions()
+	detector = stopsAndTransitions.StopDetector(_settings.Settings())
+	middle = 50
+	output = pd.concat([
+		detector.update(df.iloc[:middle]),
+		detector.flush('T0', 'S0'),
+		detector.update(df.iloc[middle:]),
+		detector.flush()
+	], ignore_index=True)
+
+	stops = output.loc[output['type'] == 'stop']
+	assert len(stops) == 4
+	assert stops['block'].is_unique
+	#every block (stop or transition) has one number and the numbers keep increasing
+	blocks = output.groupby('block', sort=False)['type'].nunique()
+	assert (blocks == 1).all()
+	assert output['block'].is_monotonic_increasing
+
+
+def test_detector_without_flush_matches_stops_transitions():
+	df = pd.concat([positions('T0'), positions('T1')], ignore_index=True)
+	settings = _settings.Settings()
+	detector = stopsAndTransitions.StopDetector(settings)
+	output = pd.concat([detector.update(df), detector.flush()], ignore_index=True)
+	expected = stopsAndTransitions.stops_transitions(df, settings)
+
+	#the last block of each tracker is returned by flush (after the blocks of the other trackers)
+	columns = ['tracker', 'session', 'block', 'type', 'timestamp', 'x', 'y']
+	output = output[columns].astype({'tracker': str, 'session': str}).sort_values(['tracker', 'block', 'timestamp'], kind='mergesort')
+	expected = expected[columns].astype({'tracker': str, 'session': str}).sort_values(['tracker', 'block', 'timestamp'], kind='mergesort')
+	pd.testing.assert_frame_equal(output.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)